@@ -0,0 +1,89 @@
+from settings import *
+from noise import perm, perm_grad_index3
+from opensimplex.internals import _noise2, _noise3
+
+
+# grid versions of noise.noise2 / noise.noise3, one compiled call per tile or block
+# instead of one per sample. Sample (i, j) of a grid at x0, z0 is taken at the
+# integer world position (x0 + i, z0 + j) scaled by the frequency, so a grid gives
+# bit-identical values to the scalar calls it replaces.
+
+
+@njit(nogil=True, cache=True)
+def noise2_grid(out, x0, z0, freq):
+    for x in range(out.shape[0]):
+        for z in range(out.shape[1]):
+            out[x, z] = _noise2((x0 + x) * freq, (z0 + z) * freq, perm)
+
+
+@njit(nogil=True, cache=True)
+def fbm2_grid(out, x0, z0, freq, amplitudes, offsets):
+    # fused octaves, the frequency doubles per octave and
+    # out[x, z] += noise * amplitudes[i] + offsets[i] is accumulated octave by octave
+    for x in range(out.shape[0]):
+        for z in range(out.shape[1]):
+            f = freq
+            value = out[x, z]
+            for i in range(len(amplitudes)):
+                value += _noise2((x0 + x) * f, (z0 + z) * f, perm) * amplitudes[i] + offsets[i]
+                f *= 2
+            out[x, z] = value
+
+
+@njit(nogil=True, cache=True)
+def fbm3(x, y, z, freq, amplitudes):
+    f = freq
+    value = 0.0
+    for i in range(len(amplitudes)):
+        value += _noise3(x * f, y * f, z * f, perm, perm_grad_index3) * amplitudes[i]
+        f *= 2
+    return value
+
+
+@njit(nogil=True, cache=True)
+def fbm3_block(out, x0, y0, z0, freq, amplitudes, y_start, y_stop):
+    # out[x, z, y] for y in [y_start[x, z], y_stop[x, z]) only, the rest is left untouched
+    for x in range(out.shape[0]):
+        for z in range(out.shape[1]):
+            for y in range(y_start[x, z], y_stop[x, z]):
+                out[x, z, y] = fbm3(x0 + x, y0 + y, z0 + z, freq, amplitudes)
+
+
+@njit(nogil=True, cache=True)
+def fbm3_block_lerp(out, x0, y0, z0, freq, amplitudes, y_start, y_stop, step):
+    # fbm3_block sampled on a lattice every step voxels and trilinearly interpolated in between.
+    # x0, y0, z0 must be multiples of step, the lattice is then aligned to world coordinates
+    # and neighbouring blocks agree on their shared faces
+    y_min, y_max = out.shape[2], 0
+    for x in range(out.shape[0]):
+        for z in range(out.shape[1]):
+            if y_start[x, z] < y_stop[x, z]:
+                y_min = min(y_min, y_start[x, z])
+                y_max = max(y_max, y_stop[x, z])
+    if y_min >= y_max:
+        return
+
+    # lattice cells covering the used y range only
+    ly0 = y_min // step
+    nx = (out.shape[0] - 1) // step + 2
+    nz = (out.shape[1] - 1) // step + 2
+    ny = (y_max - 1) // step - ly0 + 2
+    lattice = np.empty((nx, nz, ny))
+    for i in range(nx):
+        for k in range(nz):
+            for j in range(ny):
+                lattice[i, k, j] = fbm3(x0 + i * step, y0 + (ly0 + j) * step, z0 + k * step, freq, amplitudes)
+
+    for x in range(out.shape[0]):
+        i, tx = x // step, x % step / step
+        for z in range(out.shape[1]):
+            k, tz = z // step, z % step / step
+            for y in range(y_start[x, z], y_stop[x, z]):
+                j, ty = y // step - ly0, y % step / step
+                c00 = lattice[i, k, j] * (1 - tx) + lattice[i + 1, k, j] * tx
+                c10 = lattice[i, k + 1, j] * (1 - tx) + lattice[i + 1, k + 1, j] * tx
+                c01 = lattice[i, k, j + 1] * (1 - tx) + lattice[i + 1, k, j + 1] * tx
+                c11 = lattice[i, k + 1, j + 1] * (1 - tx) + lattice[i + 1, k + 1, j + 1] * tx
+                c0 = c00 * (1 - tz) + c10 * tz
+                c1 = c01 * (1 - tz) + c11 * tz
+                out[x, z, y] = c0 * (1 - ty) + c1 * ty
@@ -0,0 +1,98 @@
+import struct
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from settings import *
+from heightmap import HeightmapCache
+from terrain_gen import generate_terrain
+from world_data_handler import RUN_FMT, RUN_SIZE, pack_chunk_to_bytes, unpack_chunk_from_bytes
+
+
+# previous per-voxel / per-run implementations, kept here as the baseline
+def pack_chunk_to_bytes_py(chunk_voxels):
+    parts = []
+    curr = int(chunk_voxels[0])
+    cnt = 1
+    for v in chunk_voxels[1:]:
+        v = int(v)
+        if v == curr:
+            cnt += 1
+        else:
+            parts.append(struct.pack(RUN_FMT, cnt, curr))
+            curr = v
+            cnt = 1
+    parts.append(struct.pack(RUN_FMT, cnt, curr))
+    return b''.join(parts)
+
+
+def unpack_chunk_from_bytes_py(data):
+    out = []
+    offset = 0
+    while offset + RUN_SIZE <= len(data):
+        out.append(struct.unpack_from(RUN_FMT, data, offset))
+        offset += RUN_SIZE
+    arr = np.empty(sum(cnt for cnt, _ in out), dtype=np.uint8)
+    pos = 0
+    for cnt, vid in out:
+        arr[pos:pos + cnt] = vid
+        pos += cnt
+    return arr
+
+
+def get_test_chunks():
+    rng = np.random.default_rng(SEED)
+    chunks = [
+        np.zeros(CHUNK_VOL, dtype='uint8'),
+        np.full(CHUNK_VOL, STONE, dtype='uint8'),
+        rng.integers(0, 8, CHUNK_VOL).astype('uint8'),
+    ]
+    # surface chunks as produced by the terrain generator
+    heightmap = HeightmapCache()
+    for x in range(4):
+        voxels = np.zeros(CHUNK_VOL, dtype='uint8')
+        heights = heightmap.get(WORLD_W // 2 + x, WORLD_D // 2)
+        generate_terrain(voxels, (WORLD_W // 2 + x) * CHUNK_SIZE, 0, WORLD_D // 2 * CHUNK_SIZE, heights)
+        chunks.append(voxels)
+    return chunks
+
+
+def timeit(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    chunks = get_test_chunks()
+
+    # round trip, and byte-identical output with the old encoder
+    for voxels in chunks:
+        data = pack_chunk_to_bytes(voxels)
+        assert data == pack_chunk_to_bytes_py(voxels)
+        assert np.array_equal(unpack_chunk_from_bytes(data), voxels)
+        assert np.array_equal(unpack_chunk_from_bytes(memoryview(data)), voxels)
+    print(f'round trip ok for {len(chunks)} chunks')
+
+    terrain = chunks[-1]
+    data = pack_chunk_to_bytes(terrain)
+    print(f'terrain chunk: {len(data) // RUN_SIZE} runs')
+    for name, old, new, arg in (
+        ('encode', pack_chunk_to_bytes_py, pack_chunk_to_bytes, terrain),
+        ('decode', unpack_chunk_from_bytes_py, unpack_chunk_from_bytes, data),
+    ):
+        t_old, t_new = timeit(old, arg, repeat=2), timeit(new, arg)
+        print(f'{name}: {t_old * 1e3:8.3f} ms -> {t_new * 1e3:8.3f} ms  ({t_old / t_new:.0f}x)')
+
+    # decoding in the loader pool
+    payloads = [data] * 256
+    for workers in (1, 2, 4):
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            t = timeit(lambda: list(ex.map(unpack_chunk_from_bytes, payloads)), repeat=3)
+        print(f'decode x{len(payloads)} with {workers} threads: {t * 1e3:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
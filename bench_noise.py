@@ -0,0 +1,137 @@
+import time
+import numpy as np
+from settings import *
+from noise import noise2, noise3
+from batch_noise import fbm3_block
+from terrain_gen import get_height, get_height_tile, generate_terrain, set_voxel_id
+from heightmap import HeightmapCache
+
+
+# previous per-sample implementations, kept here as the baseline
+@njit
+def get_height_tile_scalar(out, x0, z0):
+    for x in range(out.shape[0]):
+        for z in range(out.shape[1]):
+            out[x, z] = get_height(x0 + x, z0 + z)
+
+
+@njit
+def noise3_block_scalar(out, x0, y0, z0, freq):
+    for x in range(out.shape[0]):
+        for z in range(out.shape[1]):
+            for y in range(out.shape[2]):
+                out[x, z, y] = noise3((x0 + x) * freq, (y0 + y) * freq, (z0 + z) * freq)
+
+
+@njit
+def generate_terrain_scalar(voxels, cx, cy, cz, heights):
+    for x in range(CHUNK_SIZE):
+        wx = x + cx
+        for z in range(CHUNK_SIZE):
+            wz = z + cz
+            world_height = heights[x, z]
+            local_height = min(world_height - cy, CHUNK_SIZE)
+
+            for y in range(local_height):
+                wy = y + cy
+                cave = (noise3(wx * 0.09, wy * 0.09, wz * 0.09) > 0 and
+                        noise2(wx * 0.1, wz * 0.1) * 3 + 3 < wy < world_height - 10)
+                set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height, cave)
+
+
+def timeit(func, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name, samples, t_old, t_new):
+    print(f'{name}: {samples / t_old / 1e6:7.2f} -> {samples / t_new / 1e6:7.2f} M samples/s  ({t_old / t_new:.1f}x)')
+
+
+def cave_diff(tiles, heightmap, step):
+    # voxels that differ from the exact cave noise, and the share of cave air under the surface
+    changed = total = air_exact = air_lerp = 0
+    for x0, z0 in tiles:
+        heights = heightmap.get(x0 // CHUNK_SIZE, z0 // CHUNK_SIZE)
+        for cy in range(0, heights.max(), CHUNK_SIZE):
+            exact, lerp = np.zeros([2, CHUNK_VOL], dtype='uint8')
+            generate_terrain(exact, x0, cy, z0, heights, 1)
+            generate_terrain(lerp, x0, cy, z0, heights, step)
+            below = (np.arange(CHUNK_SIZE)[:, None, None] + cy < heights.T[None, :, :] - 1).reshape(-1)
+            changed += np.count_nonzero(exact != lerp)
+            total += np.count_nonzero(below)
+            air_exact += np.count_nonzero(below & (exact == 0))
+            air_lerp += np.count_nonzero(below & (lerp == 0))
+    print(f'cave step {step}: {changed / total:6.2%} of underground voxels differ, '
+          f'cave air {air_exact / total:6.2%} exact vs {air_lerp / total:6.2%}')
+
+
+def print_slice(x0, z0, heights, step, z=CHUNK_SIZE // 2):
+    # x/y slice through the lowest chunk, exact on the left, interpolated on the right
+    exact, lerp = np.zeros([2, CHUNK_VOL], dtype='uint8')
+    generate_terrain(exact, x0, 0, z0, heights, 1)
+    generate_terrain(lerp, x0, 0, z0, heights, step)
+    exact = exact.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[:, z]
+    lerp = lerp.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[:, z]
+    for y in range(CHUNK_SIZE - 1, -1, -1):
+        row = lambda voxels: ''.join('#' if v else '.' for v in voxels[y])
+        print(f'{row(exact)}   {row(lerp)}')
+
+
+def main():
+    tiles = [((WORLD_W // 2 + i) * CHUNK_SIZE, (WORLD_D // 2 + j) * CHUNK_SIZE) for i in range(4) for j in range(4)]
+
+    # batched and scalar paths must give identical terrain
+    heightmap = HeightmapCache()
+    n_chunks = 0
+    for x0, z0 in tiles:
+        old, new = np.empty([2, CHUNK_SIZE, CHUNK_SIZE], dtype='int32')
+        get_height_tile_scalar(old, x0, z0)
+        get_height_tile(new, x0, z0)
+        assert np.array_equal(old, new)
+
+        heights = heightmap.get(x0 // CHUNK_SIZE, z0 // CHUNK_SIZE)
+        for cy in range(0, new.max(), CHUNK_SIZE):
+            old_voxels, new_voxels = np.zeros([2, CHUNK_VOL], dtype='uint8')
+            generate_terrain_scalar(old_voxels, x0, cy, z0, heights)
+            generate_terrain(new_voxels, x0, cy, z0, heights)
+            assert np.array_equal(old_voxels, new_voxels)
+            n_chunks += 1
+    print(f'identical output for {len(tiles)} height tiles and {n_chunks} chunks')
+
+    x0, z0 = tiles[0]
+    tile = np.empty([CHUNK_SIZE, CHUNK_SIZE], dtype='int32')
+    report('height tile', CHUNK_AREA,
+           timeit(get_height_tile_scalar, tile, x0, z0), timeit(get_height_tile, tile, x0, z0))
+
+    block = np.empty([CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE])
+    y_start = np.zeros([CHUNK_SIZE, CHUNK_SIZE], dtype='int64')
+    y_stop = np.full([CHUNK_SIZE, CHUNK_SIZE], CHUNK_SIZE, dtype='int64')
+    report('noise3 block', CHUNK_VOL,
+           timeit(noise3_block_scalar, block, x0, 0, z0, 0.09),
+           timeit(fbm3_block, block, x0, 0, z0, 0.09, np.ones(1), y_start, y_stop))
+
+    # whole chunks, deep ones are dominated by the cave noise
+    heights = heightmap.get(x0 // CHUNK_SIZE, z0 // CHUNK_SIZE)
+    voxels = np.zeros(CHUNK_VOL, dtype='uint8')
+    for cy in range(0, heights.max(), CHUNK_SIZE):
+        report(f'chunk y={cy:3d}', CHUNK_VOL,
+               timeit(generate_terrain_scalar, voxels, x0, cy, z0, heights),
+               timeit(generate_terrain, voxels, x0, cy, z0, heights, 1))
+
+    # interpolated cave noise against the exact one
+    for step in (2, 4, 8):
+        report(f'chunk y=  0, cave step {step}', CHUNK_VOL,
+               timeit(generate_terrain, voxels, x0, 0, z0, heights, 1),
+               timeit(generate_terrain, voxels, x0, 0, z0, heights, step))
+    for step in (2, 4, 8):
+        cave_diff(tiles, heightmap, step)
+    print_slice(x0, z0, heights, 4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+from settings import *
+from meshes.chunk_mesh import ALL_SECTIONS
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+
+class ChunkMesher:
+    def __init__(self, world, max_workers=MESH_WORKERS):
+        self.world = world
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_in_flight = max_workers * 2
+        # chunk index -> (chunk, sections) waiting to be meshed, repeated requests are merged
+        self.queue = {}
+        # chunk index -> (chunk, sections, future of their vertex data)
+        self.pending = {}
+
+    def request(self, chunk, sections=ALL_SECTIONS):
+        # only marks the sections, they are meshed from update within the frame budget
+        if chunk.index in self.queue:
+            queued_chunk, queued_sections = self.queue[chunk.index]
+            if queued_chunk is chunk:
+                sections = queued_sections | set(sections)
+        self.queue[chunk.index] = chunk, set(sections)
+
+    def submit(self, chunk, sections):
+        # a newer build replaces a running one and takes over the sections it was going to build
+        if chunk.index in self.pending:
+            old_chunk, old_sections, future = self.pending.pop(chunk.index)
+            future.cancel()
+            if old_chunk is chunk:
+                sections = sections | set(old_sections)
+        sections = tuple(sorted(sections))
+
+        # neighbourhood is copied on the main thread, workers never touch the voxel store
+        padded_voxels = self.world.voxel_store.get_padded(chunk.index)
+        future = self.executor.submit(chunk.mesh.build_vertex_data, padded_voxels, sections)
+        self.pending[chunk.index] = chunk, sections, future
+
+    def cancel(self, chunk_index):
+        self.queue.pop(chunk_index, None)
+        if chunk_index in self.pending:
+            self.pending.pop(chunk_index)[2].cancel()
+
+    def dispatch(self, budget_ms=REMESH_BUDGET_MS, max_in_flight=None):
+        # queued chunks nearest to the camera first
+        if not self.queue:
+            return
+        max_in_flight = max_in_flight or self.max_in_flight
+        chunk_indices = np.fromiter(self.queue, dtype='int64', count=len(self.queue))
+        centers = self.world.engine.player.frustum.centers[chunk_indices]
+        distance = np.sum((centers - np.array(self.world.engine.player.position)) ** 2, axis=1)
+
+        start = time.perf_counter()
+        for chunk_index in chunk_indices[np.argsort(distance)].tolist():
+            if len(self.pending) >= max_in_flight or time.perf_counter() - start > budget_ms * 0.001:
+                break
+            chunk, sections = self.queue.pop(chunk_index)
+            if not chunk.mesh:
+                continue
+            if self.world.voxel_store.is_hidden(chunk_index):
+                # all air or buried in solid neighbours, the whole chunk has no faces
+                if chunk_index in self.pending:
+                    self.pending.pop(chunk_index)[2].cancel()
+                chunk.mesh.release()
+                self.world.update_render_list(chunk)
+                continue
+            self.submit(chunk, sections)
+
+    def update(self, budget_ms=MESH_UPLOAD_BUDGET_MS):
+        self.dispatch()
+        start = time.perf_counter()
+        for chunk_index, (chunk, _, future) in list(self.pending.items()):
+            if not future.done():
+                continue
+            if time.perf_counter() - start > budget_ms * 0.001:
+                break
+            self.upload(chunk_index, chunk, future)
+
+    def flush(self):
+        # block until every requested mesh is uploaded
+        self.dispatch(budget_ms=float('inf'), max_in_flight=float('inf'))
+        for chunk_index, (chunk, _, future) in list(self.pending.items()):
+            future.result()
+            self.upload(chunk_index, chunk, future)
+
+    def upload(self, chunk_index, chunk, future):
+        del self.pending[chunk_index]
+        # the chunk may have been evicted while it was meshed
+        if self.world.chunks[chunk_index] is chunk and chunk.mesh:
+            chunk.mesh.upload(future.result())
+            self.world.update_render_list(chunk)
+
+    def shutdown(self):
+        self.queue.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
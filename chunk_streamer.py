@@ -0,0 +1,101 @@
+from settings import *
+from world_data_handler import WorldReader
+from terrain_gen import generate_terrain
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import time
+
+
+class ChunkStreamer:
+    def __init__(self, world, max_workers=STREAM_WORKERS):
+        self.world = world
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_in_flight = max_workers * 2
+        self.reader = WorldReader(CHUNK_FILE_BASE_DIR / "world.dat")
+
+        self.center = None
+        # heap of (distance, chunk index) waiting to be submitted
+        self.queue = []
+        # chunk index -> future of the running load
+        self.in_flight = {}
+
+    def update(self, center):
+        if center != self.center:
+            self.center = center
+            self.world.unload_far_chunks(center[0], center[2])
+            self.rescan()
+        self.submit()
+        self.integrate()
+
+    def in_range(self, idx):
+        R = RENDER_DISTANCE // 2
+        cx, _, cz = self.center
+        x, z = idx % WORLD_W, idx % WORLD_AREA // WORLD_W
+        return cx - R <= x < cx + R and cz - R <= z < cz + R
+
+    def distance(self, idx):
+        cx, cy, cz = self.center
+        x, y, z = idx % WORLD_W, idx // WORLD_AREA, idx % WORLD_AREA // WORLD_W
+        return (x - cx) ** 2 + (y - cy) ** 2 + (z - cz) ** 2
+
+    def rescan(self):
+        R = RENDER_DISTANCE // 2
+        cx, _, cz = self.center
+        x0, x1 = max(0, cx - R), min(WORLD_W, cx + R)
+        z0, z1 = max(0, cz - R), min(WORLD_D, cz + R)
+
+        # requests that went out of range are dropped with the old queue
+        self.queue = []
+        for x in range(x0, x1):
+            for y in range(WORLD_H):
+                for z in range(z0, z1):
+                    idx = x + WORLD_W * z + WORLD_AREA * y
+                    if self.world.chunks[idx] is None and idx not in self.in_flight:
+                        self.queue.append((self.distance(idx), idx))
+        heapq.heapify(self.queue)
+
+    def submit(self):
+        while self.queue and len(self.in_flight) < self.max_in_flight:
+            _, idx = heapq.heappop(self.queue)
+            self.in_flight[idx] = self.executor.submit(self.load_chunk, idx)
+
+    def load_chunk(self, idx):
+        # edited chunks live in the region files, then an old world.dat if there is one,
+        # anything else is regenerated from the seed
+        vox = self.world.storage.load_chunk(idx)
+        if vox is None:
+            vox = self.reader.load_chunk(idx)
+        if vox is None:
+            vox = self.generate_chunk(idx)
+        return vox
+
+    def generate_chunk(self, idx):
+        x, y, z = idx % WORLD_W, idx // WORLD_AREA, idx % WORLD_AREA // WORLD_W
+        heights = self.world.heightmap.get(x, z)
+        if self.world.heightmap.is_above_terrain(heights, y):
+            return None
+        vox = np.zeros(CHUNK_VOL, dtype='uint8')
+        generate_terrain(vox, x * CHUNK_SIZE, y * CHUNK_SIZE, z * CHUNK_SIZE, heights)
+        return vox
+
+    def integrate(self):
+        done = [idx for idx, future in self.in_flight.items() if future.done()]
+        done.sort(key=self.distance)
+
+        start = time.perf_counter()
+        for idx in done:
+            # always integrate at least one chunk so streaming keeps moving
+            if time.perf_counter() - start > STREAM_BUDGET_MS * 0.001:
+                break
+            future = self.in_flight.pop(idx)
+            if not self.in_range(idx) or self.world.chunks[idx] is not None:
+                continue
+            try:
+                vox = future.result()
+            except Exception:
+                vox = None
+            self.world.add_chunk(idx, vox)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.reader.close()
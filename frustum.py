@@ -11,6 +11,15 @@ class Frustum:
         self.factor_x = 1.0 / math.cos(half_x := H_FOV * 0.5)
         self.tan_x = math.tan(half_x)
 
+        # centres of every chunk slot, indexed like World.chunks
+        index = np.arange(WORLD_VOL)
+        positions = np.stack([index % WORLD_W, index // WORLD_AREA, index % WORLD_AREA // WORLD_W], axis=1)
+        self.centers = (positions + 0.5) * CHUNK_SIZE
+
+        # visibility of the last camera state
+        self.camera_state = None
+        self.mask = None
+
     def is_on_frustum(self, chunk):
         # vector to sphere center
         sphere_vec = chunk.center - self.cam.position
@@ -33,3 +42,22 @@ class Frustum:
             return False
 
         return True
+
+    def get_visible(self):
+        # visibility mask over all chunk slots, recomputed only when the camera moved or turned
+        camera_state = tuple(self.cam.position) + tuple(self.cam.forward)
+        if camera_state != self.camera_state:
+            self.camera_state = camera_state
+            self.mask = self.get_mask(self.centers)
+        return self.mask
+
+    def get_mask(self, centers):
+        # is_on_frustum for many sphere centres at once
+        sphere_vec = centers - np.array(self.cam.position)
+        basis = np.array([self.cam.forward, self.cam.up, self.cam.right]).T
+        sz, sy, sx = (sphere_vec @ basis).T
+
+        mask = (NEAR - CHUNK_SPHERE_RADIUS <= sz) & (sz <= FAR + CHUNK_SPHERE_RADIUS)
+        mask &= np.abs(sy) <= self.factor_y * CHUNK_SPHERE_RADIUS + sz * self.tan_y
+        mask &= np.abs(sx) <= self.factor_x * CHUNK_SPHERE_RADIUS + sz * self.tan_x
+        return mask
@@ -0,0 +1,48 @@
+from settings import *
+from terrain_gen import get_height_tile
+from numba import prange
+from collections import OrderedDict
+import threading
+
+
+@njit(nogil=True)
+def compute_height_tile(out, cx, cz):
+    # terrain height of every column of the chunk column starting at voxel (cx, cz), indexed [x, z]
+    get_height_tile(out, cx, cz)
+
+
+@njit(parallel=True)
+def compute_height_tiles(out, columns):
+    for i in prange(len(columns)):
+        compute_height_tile(out[i], columns[i, 0] * CHUNK_SIZE, columns[i, 1] * CHUNK_SIZE)
+
+
+class HeightmapCache:
+    # height tiles per chunk column, shared by every vertical chunk of the column
+    def __init__(self, capacity=HEIGHTMAP_CACHE_SIZE):
+        self.capacity = capacity
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, x, z):
+        key = x, z
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+                return tile
+
+        tile = np.empty([CHUNK_SIZE, CHUNK_SIZE], dtype='int32')
+        compute_height_tile(tile, x * CHUNK_SIZE, z * CHUNK_SIZE)
+        tile.flags.writeable = False
+
+        with self.lock:
+            self.tiles[key] = tile
+            while len(self.tiles) > self.capacity:
+                self.tiles.popitem(last=False)
+        return tile
+
+    @staticmethod
+    def is_above_terrain(tile, y):
+        # no column reaches into the chunk, so it is empty and trees cannot start in it either
+        return y * CHUNK_SIZE >= tile.max()
@@ -46,7 +46,11 @@ class VoxelEngine:
 
         self.delta_time = self.clock.tick()
         self.time = pg.time.get_ticks() * 0.001
-        pg.display.set_caption(f'{self.clock.get_fps() :.0f}')
+        world = self.scene.world
+        pg.display.set_caption(
+            f'{self.clock.get_fps() :.0f} | chunks: {len(world.loaded)} '
+            f'(+{world.load_count} -{world.unload_count})'
+        )
 
     def render(self):
         self.ctx.clear(color=BG_COLOR)
@@ -64,6 +68,7 @@ class VoxelEngine:
             self.handle_events()
             self.update()
             self.render()
+        self.scene.world.close()
         pg.quit()
         sys.exit()
 
@@ -11,18 +11,32 @@ class BaseMesh:
         self.vbo_format = None
         # attribute names according to the format: ("in_position", "in_color")
         self.attrs: tuple[str, ...] = None
+        # vertex buffer object
+        self.vbo = None
         # vertex array object
         self.vao = None
 
     def get_vertex_data(self) -> np.array: ...
 
-    def get_vao(self):
-        vertex_data = self.get_vertex_data()
+    def get_vao(self, vertex_data=None):
+        if vertex_data is None:
+            vertex_data = self.get_vertex_data()
         vbo = self.ctx.buffer(vertex_data)
         vao = self.ctx.vertex_array(
             self.program, [(vbo, self.vbo_format, *self.attrs)], skip_errors=True
         )
+        # old buffers are only dropped once the new ones exist
+        self.release()
+        self.vbo = vbo
         return vao
 
+    def release(self):
+        if self.vao:
+            self.vao.release()
+            self.vao = None
+        if self.vbo:
+            self.vbo.release()
+            self.vbo = None
+
     def render(self):
         self.vao.render()
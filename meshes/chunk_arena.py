@@ -0,0 +1,220 @@
+from settings import *
+import bisect
+
+
+class ArenaAllocator:
+    # cpu side bookkeeping of one large buffer, sizes and offsets are in vertices
+    def __init__(self, capacity):
+        self.capacity = capacity
+        # key -> (offset, size) of live blocks
+        self.blocks = {}
+        # free blocks sorted by offset, neighbours are always merged
+        self.free_offsets = [0]
+        self.free_sizes = [capacity]
+
+    def __contains__(self, key):
+        return key in self.blocks
+
+    @property
+    def used(self):
+        return sum(size for _, size in self.blocks.values())
+
+    @property
+    def free(self):
+        return self.capacity - self.used
+
+    @property
+    def largest_free(self):
+        return max(self.free_sizes, default=0)
+
+    def alloc(self, key, size):
+        # first fit, returns the offset or None if no free block is large enough
+        if size <= 0:
+            raise ValueError('arena blocks must not be empty')
+        for i, free_size in enumerate(self.free_sizes):
+            if free_size >= size:
+                offset = self.free_offsets[i]
+                if free_size == size:
+                    del self.free_offsets[i]
+                    del self.free_sizes[i]
+                else:
+                    self.free_offsets[i] += size
+                    self.free_sizes[i] -= size
+                self.blocks[key] = offset, size
+                return offset
+        return None
+
+    def release(self, key):
+        if key not in self.blocks:
+            return
+        offset, size = self.blocks.pop(key)
+        i = bisect.bisect(self.free_offsets, offset)
+
+        # merge with the free block after and before it
+        if i < len(self.free_offsets) and offset + size == self.free_offsets[i]:
+            size += self.free_sizes[i]
+            del self.free_offsets[i]
+            del self.free_sizes[i]
+        if i > 0 and self.free_offsets[i - 1] + self.free_sizes[i - 1] == offset:
+            self.free_sizes[i - 1] += size
+        else:
+            self.free_offsets.insert(i, offset)
+            self.free_sizes.insert(i, size)
+
+    def rename(self, key, new_key):
+        self.blocks[new_key] = self.blocks.pop(key)
+
+    def compact(self, capacity=None):
+        # pack live blocks back to back from offset 0, optionally into a larger capacity.
+        # returns (key, old offset, new offset, size) for every block so the data can be copied
+        capacity = self.capacity if capacity is None else capacity
+        if self.used > capacity:
+            raise ValueError('arena capacity smaller than the live blocks')
+        moves = []
+        offset = 0
+        for key, (old_offset, size) in sorted(self.blocks.items(), key=lambda item: item[1][0]):
+            moves.append((key, old_offset, offset, size))
+            self.blocks[key] = offset, size
+            offset += size
+
+        self.capacity = capacity
+        self.free_offsets = [offset] if offset < capacity else []
+        self.free_sizes = [capacity - offset] if offset < capacity else []
+        return moves
+
+
+class ChunkArena:
+    # all chunk meshes of one vertex format in a single vertex buffer, drawn with one indirect
+    # multi draw per frame (GL 4.3) or one draw per chunk on a shared vao otherwise.
+    # the sections of a chunk are kept back to back in one block so a chunk is always one draw range
+    def __init__(self, engine, program, vbo_format, attrs, capacity=ARENA_VERTICES):
+        self.ctx = engine.ctx
+        self.program = program
+        self.vbo_format = vbo_format
+        self.attrs = attrs
+        self.vertex_size = 4 * sum(int(fmt[:1]) for fmt in vbo_format.split())
+        self.allocator = ArenaAllocator(capacity)
+        self.multi_draw = self.ctx.version_code >= 430
+
+        # first vertex and vertex count of every section keyed chunk_index * SECTION_VOL + section,
+        # count 0 if it has no mesh
+        self.first = np.zeros(WORLD_VOL * SECTION_VOL, dtype='int64')
+        self.count = np.zeros(WORLD_VOL * SECTION_VOL, dtype='int64')
+        # and the block of every chunk
+        self.chunk_first = np.zeros(WORLD_VOL, dtype='u4')
+        self.chunk_count = np.zeros(WORLD_VOL, dtype='u4')
+        # world space origin of every chunk slot
+        index = np.arange(WORLD_VOL)
+        positions = np.stack([index % WORLD_W, index // WORLD_AREA, index % WORLD_AREA // WORLD_W], axis=1)
+        self.origins = (positions * CHUNK_SIZE).astype('f4')
+
+        self.vbo = self.ctx.buffer(reserve=capacity * self.vertex_size)
+        if self.multi_draw:
+            # per draw origin as an instanced attribute, picked by the base instance of each command
+            self.origin_buffer = self.ctx.buffer(reserve=WORLD_VOL * 3 * 4)
+            self.command_buffer = self.ctx.buffer(reserve=WORLD_VOL * 5 * 4)
+        self.vao = self.get_vao()
+
+    def __contains__(self, chunk_index):
+        return bool(self.chunk_count[chunk_index])
+
+    def get_vao(self):
+        content = [(self.vbo, self.vbo_format, *self.attrs)]
+        if self.multi_draw:
+            content.append((self.origin_buffer, '3f/i', 'chunk_origin'))
+        return self.ctx.vertex_array(self.program, content, skip_errors=True)
+
+    def upload(self, chunk_index, section_meshes):
+        # (section, vertex data) pairs, empty data removes the section. the chunk gets a new block
+        # holding the new sections and copies of the ones it keeps, draws issued before still see the old mesh
+        keys = np.arange(chunk_index * SECTION_VOL, (chunk_index + 1) * SECTION_VOL)
+        vertex_data = {section: data for section, data in section_meshes}
+        sizes = self.count[keys].copy()
+        for section, data in vertex_data.items():
+            sizes[section] = data.nbytes // self.vertex_size
+
+        total = int(sizes.sum())
+        if not total:
+            self.release(chunk_index)
+            return
+
+        # the old block stays live until its sections are copied, the new one is placed under a temporary key
+        new_key = -1 - chunk_index
+        offset = self.allocator.alloc(new_key, total)
+        if offset is None:
+            self.make_room(total)
+            offset = self.allocator.alloc(new_key, total)
+
+        firsts = offset + np.cumsum(sizes) - sizes
+        for section in range(SECTION_VOL):
+            size = int(sizes[section])
+            if not size:
+                continue
+            if section in vertex_data:
+                self.vbo.write(vertex_data[section], offset=int(firsts[section]) * self.vertex_size)
+            else:
+                self.ctx.copy_buffer(self.vbo, self.vbo, size * self.vertex_size,
+                                     read_offset=int(self.first[keys[section]]) * self.vertex_size,
+                                     write_offset=int(firsts[section]) * self.vertex_size)
+
+        self.allocator.release(chunk_index)
+        self.allocator.rename(new_key, chunk_index)
+        self.first[keys] = firsts
+        self.count[keys] = sizes
+        self.chunk_first[chunk_index] = offset
+        self.chunk_count[chunk_index] = total
+
+    def release(self, chunk_index):
+        self.allocator.release(chunk_index)
+        self.count[chunk_index * SECTION_VOL:(chunk_index + 1) * SECTION_VOL] = 0
+        self.chunk_count[chunk_index] = 0
+
+    def make_room(self, size):
+        # defragment, and double the buffer until the block fits after the live data
+        capacity = self.allocator.capacity
+        while self.allocator.used + size > capacity:
+            capacity *= 2
+        self.relocate(capacity)
+
+    def relocate(self, capacity):
+        vbo = self.ctx.buffer(reserve=capacity * self.vertex_size)
+        for chunk_index, old_offset, offset, size in self.allocator.compact(capacity):
+            self.ctx.copy_buffer(vbo, self.vbo, size * self.vertex_size,
+                                 read_offset=old_offset * self.vertex_size, write_offset=offset * self.vertex_size)
+            self.first[chunk_index * SECTION_VOL:(chunk_index + 1) * SECTION_VOL] += offset - old_offset
+            self.chunk_first[chunk_index] = offset
+        self.vao.release()
+        self.vbo.release()
+        self.vbo = vbo
+        self.vao = self.get_vao()
+
+    def render(self, chunk_indices):
+        # one draw per chunk, in the given chunk order
+        chunk_indices = np.asarray(chunk_indices)
+        chunk_indices = chunk_indices[self.chunk_count[chunk_indices] > 0]
+        if not len(chunk_indices):
+            return
+
+        if self.multi_draw:
+            # (count, instance count, first, base instance) per chunk,
+            # moderngl reads commands with a 20 byte stride so the last word is padding
+            commands = np.zeros([len(chunk_indices), 5], dtype='u4')
+            commands[:, 0] = self.chunk_count[chunk_indices]
+            commands[:, 1] = 1
+            commands[:, 2] = self.chunk_first[chunk_indices]
+            commands[:, 3] = np.arange(len(chunk_indices))
+            self.origin_buffer.write(self.origins[chunk_indices])
+            self.command_buffer.write(commands)
+            self.vao.render_indirect(self.command_buffer, count=len(chunk_indices))
+        else:
+            origin = self.program['chunk_origin']
+            for chunk_index in chunk_indices.tolist():
+                origin.value = tuple(self.origins[chunk_index])
+                self.vao.render(first=int(self.chunk_first[chunk_index]), vertices=int(self.chunk_count[chunk_index]))
+
+    def release_all(self):
+        self.vao.release()
+        self.vbo.release()
+        if self.multi_draw:
+            self.origin_buffer.release()
+            self.command_buffer.release()
@@ -1,29 +1,62 @@
-from meshes.base_mesh import BaseMesh
-from meshes.chunk_mesh_builder import build_chunk_mesh
+from settings import *
+from meshes.chunk_mesh_builder import (build_chunk_mesh, build_chunk_mesh_greedy, get_scratch_buffer, get_padded_buffer,
+                                       get_row_buffers, fill_padded_rows, get_section_origin)
 
+if GREEDY_MESHING:
+    # merged quads carry their size in a second word
+    CHUNK_PROGRAM = 'chunk_greedy'
+    CHUNK_VBO_FORMAT = '1u4 1u4'
+    CHUNK_ATTRS = ('packed_data', 'packed_size')
+else:
+    CHUNK_PROGRAM = 'chunk'
+    CHUNK_VBO_FORMAT = '1u4'
+    CHUNK_ATTRS = ('packed_data',)
 
-class ChunkMesh(BaseMesh):
+ALL_SECTIONS = tuple(range(SECTION_VOL))
+
+
+class ChunkMesh:
+    # vertex data of one chunk, the gpu side lives in the world's chunk arena
     def __init__(self, chunk):
-        super().__init__()
         self.engine = chunk.engine
         self.chunk = chunk
-        self.ctx = self.engine.ctx
-        self.program = self.engine.shader_program.chunk
-
-        self.vbo_format = '1u4'
-        self.format_size = sum(int(fmt[:1]) for fmt in self.vbo_format.split())
-        self.attrs = ('packed_data',)
-        self.vao = self.get_vao()
-
-    def rebuild(self):
-        print("Rebuilding chunk mesh at position:", self.chunk.position)
-        self.vao = self.get_vao()
-
-    def get_vertex_data(self):
-        mesh = build_chunk_mesh(
-            chunk_voxels=self.chunk.voxels,
-            format_size=self.format_size,
-            chunk_pos=self.chunk.position,
-            world_voxels=self.chunk.world.voxels
-        )
-        return mesh
+        self.arena = chunk.world.arena
+        self.builder = build_chunk_mesh_greedy if GREEDY_MESHING else build_chunk_mesh
+        self.format_size = sum(int(fmt[:1]) for fmt in CHUNK_VBO_FORMAT.split())
+
+    def rebuild(self, sections=ALL_SECTIONS):
+        # queued only, the current mesh keeps rendering until the new one is uploaded
+        self.chunk.world.mesher.request(self.chunk, sections)
+
+    def get_vertex_data(self, sections=ALL_SECTIONS):
+        padded_voxels = self.chunk.world.voxel_store.get_padded(self.chunk.index, out=get_padded_buffer())
+        return self.build_vertex_data(padded_voxels, sections)
+
+    def build_vertex_data(self, padded_voxels, sections=ALL_SECTIONS):
+        # cpu side only, safe to run on mesher threads. returns (section, vertex data) pairs
+        solid, exposed = get_row_buffers()
+        fill_padded_rows(padded_voxels, solid, exposed)
+        section_meshes = []
+        for section in sections:
+            x0, y0, z0 = get_section_origin(section)
+            mesh = self.builder(
+                padded_voxels=padded_voxels,
+                solid=solid,
+                exposed=exposed,
+                format_size=self.format_size,
+                vertex_data=get_scratch_buffer(self.format_size),
+                x0=x0, y0=y0, z0=z0,
+                size=SECTION_SIZE
+            )
+            section_meshes.append((section, mesh))
+        return section_meshes
+
+    @property
+    def is_uploaded(self):
+        return self.chunk.index in self.arena
+
+    def upload(self, section_meshes):
+        self.arena.upload(self.chunk.index, section_meshes)
+
+    def release(self):
+        self.arena.release(self.chunk.index)
@@ -1,41 +1,97 @@
 from settings import *
 from numba import uint8
+import threading
+
+# builders mesh one section per call, worst case is a checkerboard: half the voxels solid,
+# 6 faces of 6 vertices each
+MAX_SECTION_VERTICES = SECTION_SIZE ** 3 * 18
+scratch_buffers = threading.local()
+
+
+def get_scratch_buffer(format_size):
+    # one worst case buffer per thread, reused by every mesh build on it
+    buffer = getattr(scratch_buffers, 'buffer', None)
+    if buffer is None or len(buffer) < MAX_SECTION_VERTICES * format_size:
+        buffer = scratch_buffers.buffer = np.empty(MAX_SECTION_VERTICES * format_size, dtype='uint32')
+    return buffer
+
+
+def get_padded_buffer():
+    buffer = getattr(scratch_buffers, 'padded', None)
+    if buffer is None:
+        buffer = scratch_buffers.padded = np.empty(PADDED_VOL, dtype='uint8')
+    return buffer
+
+
+def get_row_buffers():
+    buffers = getattr(scratch_buffers, 'rows', None)
+    if buffers is None:
+        buffers = scratch_buffers.rows = np.empty([2, PADDED_AREA], dtype='int64')
+    return buffers
+
+
+@njit(nogil=True)
+def fill_padded_rows(padded_voxels, solid, exposed):
+    # bit rows of the padded chunk, row z + PADDED_SIZE * y holds one bit per x.
+    # solid voxels, and solid voxels with at least one air neighbour, the only ones that can have faces
+    for r in range(PADDED_AREA):
+        bits = 0
+        for x in range(PADDED_SIZE):
+            if padded_voxels[x + PADDED_SIZE * r]:
+                bits |= 1 << x
+        solid[r] = bits
+
+    exposed[:] = 0
+    for y in range(1, PADDED_SIZE - 1):
+        for z in range(1, PADDED_SIZE - 1):
+            r = z + PADDED_SIZE * y
+            row = solid[r]
+            buried = (row << 1) & (row >> 1) & solid[r - 1] & solid[r + 1] & solid[r - PADDED_SIZE] & solid[r + PADDED_SIZE]
+            exposed[r] = row & ~buried
 
 
 @njit
-def get_ao(local_pos, world_pos, world_voxels, plane):
-    x, y, z = local_pos
-    wx, wy, wz = world_pos
+def is_section_exposed(exposed, x0, y0, z0, size):
+    bits = ((1 << size) - 1) << (x0 + 1)
+    for y in range(y0 + 1, y0 + size + 1):
+        for z in range(z0 + 1, z0 + size + 1):
+            if exposed[z + PADDED_SIZE * y] & bits:
+                return True
+    return False
 
+
+@njit
+def get_ao(solid, r, bit, plane):
+    # r and bit are the padded row and bit of the voxel in front of the face
     if plane == 'Y':
-        a = is_void((x    , y, z - 1), (wx    , wy, wz - 1), world_voxels)
-        b = is_void((x - 1, y, z - 1), (wx - 1, wy, wz - 1), world_voxels)
-        c = is_void((x - 1, y, z    ), (wx - 1, wy, wz    ), world_voxels)
-        d = is_void((x - 1, y, z + 1), (wx - 1, wy, wz + 1), world_voxels)
-        e = is_void((x    , y, z + 1), (wx    , wy, wz + 1), world_voxels)
-        f = is_void((x + 1, y, z + 1), (wx + 1, wy, wz + 1), world_voxels)
-        g = is_void((x + 1, y, z    ), (wx + 1, wy, wz    ), world_voxels)
-        h = is_void((x + 1, y, z - 1), (wx + 1, wy, wz - 1), world_voxels)
+        a = is_void(solid, r - 1, bit    )
+        b = is_void(solid, r - 1, bit - 1)
+        c = is_void(solid, r    , bit - 1)
+        d = is_void(solid, r + 1, bit - 1)
+        e = is_void(solid, r + 1, bit    )
+        f = is_void(solid, r + 1, bit + 1)
+        g = is_void(solid, r    , bit + 1)
+        h = is_void(solid, r - 1, bit + 1)
 
     elif plane == 'X':
-        a = is_void((x, y    , z - 1), (wx, wy    , wz - 1), world_voxels)
-        b = is_void((x, y - 1, z - 1), (wx, wy - 1, wz - 1), world_voxels)
-        c = is_void((x, y - 1, z    ), (wx, wy - 1, wz    ), world_voxels)
-        d = is_void((x, y - 1, z + 1), (wx, wy - 1, wz + 1), world_voxels)
-        e = is_void((x, y    , z + 1), (wx, wy    , wz + 1), world_voxels)
-        f = is_void((x, y + 1, z + 1), (wx, wy + 1, wz + 1), world_voxels)
-        g = is_void((x, y + 1, z    ), (wx, wy + 1, wz    ), world_voxels)
-        h = is_void((x, y + 1, z - 1), (wx, wy + 1, wz - 1), world_voxels)
+        a = is_void(solid, r               - 1, bit)
+        b = is_void(solid, r - PADDED_SIZE - 1, bit)
+        c = is_void(solid, r - PADDED_SIZE    , bit)
+        d = is_void(solid, r - PADDED_SIZE + 1, bit)
+        e = is_void(solid, r               + 1, bit)
+        f = is_void(solid, r + PADDED_SIZE + 1, bit)
+        g = is_void(solid, r + PADDED_SIZE    , bit)
+        h = is_void(solid, r + PADDED_SIZE - 1, bit)
 
     else:  # Z plane
-        a = is_void((x - 1, y    , z), (wx - 1, wy    , wz), world_voxels)
-        b = is_void((x - 1, y - 1, z), (wx - 1, wy - 1, wz), world_voxels)
-        c = is_void((x    , y - 1, z), (wx    , wy - 1, wz), world_voxels)
-        d = is_void((x + 1, y - 1, z), (wx + 1, wy - 1, wz), world_voxels)
-        e = is_void((x + 1, y    , z), (wx + 1, wy    , wz), world_voxels)
-        f = is_void((x + 1, y + 1, z), (wx + 1, wy + 1, wz), world_voxels)
-        g = is_void((x    , y + 1, z), (wx    , wy + 1, wz), world_voxels)
-        h = is_void((x - 1, y + 1, z), (wx - 1, wy + 1, wz), world_voxels)
+        a = is_void(solid, r              , bit - 1)
+        b = is_void(solid, r - PADDED_SIZE, bit - 1)
+        c = is_void(solid, r - PADDED_SIZE, bit    )
+        d = is_void(solid, r - PADDED_SIZE, bit + 1)
+        e = is_void(solid, r              , bit + 1)
+        f = is_void(solid, r + PADDED_SIZE, bit + 1)
+        g = is_void(solid, r + PADDED_SIZE, bit    )
+        h = is_void(solid, r + PADDED_SIZE, bit - 1)
 
     ao = (a + b + c), (g + h + a), (e + f + g), (c + d + e)
     return ao
@@ -78,18 +134,20 @@ def get_chunk_index(world_voxel_pos):
 
 
 @njit
-def is_void(local_voxel_pos, world_voxel_pos, world_voxels):
-    chunk_index = get_chunk_index(world_voxel_pos)
-    if chunk_index == -1:
-        return False
-    chunk_voxels = world_voxels[chunk_index]
+def get_padded_index(x, y, z):
+    # chunk local position, -1 and CHUNK_SIZE address the neighbour border
+    return (x + 1) + PADDED_SIZE * (z + 1) + PADDED_AREA * (y + 1)
 
-    x, y, z = local_voxel_pos
-    voxel_index = x % CHUNK_SIZE + z % CHUNK_SIZE * CHUNK_SIZE + y % CHUNK_SIZE * CHUNK_AREA
 
-    if chunk_voxels[voxel_index]:
-        return False
-    return True
+@njit
+def get_padded_row(y, z):
+    # bit row of the padded rows holding chunk local y, z, the voxel's bit is x + 1
+    return (z + 1) + PADDED_SIZE * (y + 1)
+
+
+@njit
+def is_void(solid, r, bit):
+    return not solid[r] >> bit & 1
 
 
 @njit
@@ -100,29 +158,32 @@ def add_data(vertex_data, index, *vertices):
     return index
 
 
-@njit
-def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
-    vertex_data = np.empty(CHUNK_VOL * 18 * format_size, dtype='uint32')
-    index = 0
+def get_section_origin(section):
+    # chunk local position of the first voxel of a section
+    return (section % SECTIONS * SECTION_SIZE, section // SECTION_AREA * SECTION_SIZE,
+            section % SECTION_AREA // SECTIONS * SECTION_SIZE)
 
-    for x in range(CHUNK_SIZE):
-        for y in range(CHUNK_SIZE):
-            for z in range(CHUNK_SIZE):
-                voxel_id = chunk_voxels[x + CHUNK_SIZE * z + CHUNK_AREA * y]
 
-                if not voxel_id:
+@njit(nogil=True)
+def build_chunk_mesh(padded_voxels, solid, exposed, format_size, vertex_data, x0, y0, z0, size):
+    # faces of the size^3 block of the chunk starting at x0, y0, z0
+    index = 0
+    if not is_section_exposed(exposed, x0, y0, z0, size):
+        return vertex_data[:index].copy()
+
+    for x in range(x0, x0 + size):
+        for y in range(y0, y0 + size):
+            for z in range(z0, z0 + size):
+                # air and buried voxels have no faces
+                r, bit = get_padded_row(y, z), x + 1
+                if not exposed[r] >> bit & 1:
                     continue
-
-                # voxel world position
-                cx, cy, cz = chunk_pos
-                wx = x + cx * CHUNK_SIZE
-                wy = y + cy * CHUNK_SIZE
-                wz = z + cz * CHUNK_SIZE
+                voxel_id = padded_voxels[get_padded_index(x, y, z)]
 
                 # top face
-                if is_void((x, y + 1, z), (wx, wy + 1, wz), world_voxels):
+                if is_void(solid, r + PADDED_SIZE, bit):
                     # get ao values
-                    ao = get_ao((x, y + 1, z), (wx, wy + 1, wz), world_voxels, plane='Y')
+                    ao = get_ao(solid, r + PADDED_SIZE, bit, plane='Y')
                     flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
                     # format: x, y, z, voxel_id, face_id, ao_id, flip_id
@@ -137,8 +198,8 @@ def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
                         index = add_data(vertex_data, index, v0, v3, v2, v0, v2, v1)
 
                 # bottom face
-                if is_void((x, y - 1, z), (wx, wy - 1, wz), world_voxels):
-                    ao = get_ao((x, y - 1, z), (wx, wy - 1, wz), world_voxels, plane='Y')
+                if is_void(solid, r - PADDED_SIZE, bit):
+                    ao = get_ao(solid, r - PADDED_SIZE, bit, plane='Y')
                     flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
                     v0 = pack_data(x    , y, z    , voxel_id, 1, ao[0], flip_id)
@@ -152,8 +213,8 @@ def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
                         index = add_data(vertex_data, index, v0, v2, v3, v0, v1, v2)
 
                 # right face
-                if is_void((x + 1, y, z), (wx + 1, wy, wz), world_voxels):
-                    ao = get_ao((x + 1, y, z), (wx + 1, wy, wz), world_voxels, plane='X')
+                if is_void(solid, r, bit + 1):
+                    ao = get_ao(solid, r, bit + 1, plane='X')
                     flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
                     v0 = pack_data(x + 1, y    , z    , voxel_id, 2, ao[0], flip_id)
@@ -167,8 +228,8 @@ def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
                         index = add_data(vertex_data, index, v0, v1, v2, v0, v2, v3)
 
                 # left face
-                if is_void((x - 1, y, z), (wx - 1, wy, wz), world_voxels):
-                    ao = get_ao((x - 1, y, z), (wx - 1, wy, wz), world_voxels, plane='X')
+                if is_void(solid, r, bit - 1):
+                    ao = get_ao(solid, r, bit - 1, plane='X')
                     flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
                     v0 = pack_data(x, y    , z    , voxel_id, 3, ao[0], flip_id)
@@ -182,8 +243,8 @@ def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
                         index = add_data(vertex_data, index, v0, v2, v1, v0, v3, v2)
 
                 # back face
-                if is_void((x, y, z - 1), (wx, wy, wz - 1), world_voxels):
-                    ao = get_ao((x, y, z - 1), (wx, wy, wz - 1), world_voxels, plane='Z')
+                if is_void(solid, r - 1, bit):
+                    ao = get_ao(solid, r - 1, bit, plane='Z')
                     flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
                     v0 = pack_data(x,     y,     z, voxel_id, 4, ao[0], flip_id)
@@ -197,8 +258,8 @@ def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
                         index = add_data(vertex_data, index, v0, v1, v2, v0, v2, v3)
 
                 # front face
-                if is_void((x, y, z + 1), (wx, wy, wz + 1), world_voxels):
-                    ao = get_ao((x, y, z + 1), (wx, wy, wz + 1), world_voxels, plane='Z')
+                if is_void(solid, r + 1, bit):
+                    ao = get_ao(solid, r + 1, bit, plane='Z')
                     flip_id = ao[1] + ao[3] > ao[0] + ao[2]
 
                     v0 = pack_data(x    , y    , z + 1, voxel_id, 5, ao[0], flip_id)
@@ -211,4 +272,185 @@ def build_chunk_mesh(chunk_voxels, format_size, chunk_pos, world_voxels):
                     else:
                         index = add_data(vertex_data, index, v0, v2, v1, v0, v3, v2)
 
-    return vertex_data[:index + 1]
+    return vertex_data[:index].copy()
+
+
+@njit
+def add_quad(vertex_data, index, face_id, x, y, z, w, h, voxel_id, ao, flip_id):
+    # quad of w x h voxel faces, w and h run along the face's texture u and v axes
+    if face_id == 0:
+        v0 = pack_data(x    , y + 1, z    , voxel_id, 0, ao[0], flip_id)
+        v1 = pack_data(x + w, y + 1, z    , voxel_id, 0, ao[1], flip_id)
+        v2 = pack_data(x + w, y + 1, z + h, voxel_id, 0, ao[2], flip_id)
+        v3 = pack_data(x    , y + 1, z + h, voxel_id, 0, ao[3], flip_id)
+        if flip_id:
+            order = (v1, v0, v3, v1, v3, v2)
+        else:
+            order = (v0, v3, v2, v0, v2, v1)
+
+    elif face_id == 1:
+        v0 = pack_data(x    , y, z    , voxel_id, 1, ao[0], flip_id)
+        v1 = pack_data(x + w, y, z    , voxel_id, 1, ao[1], flip_id)
+        v2 = pack_data(x + w, y, z + h, voxel_id, 1, ao[2], flip_id)
+        v3 = pack_data(x    , y, z + h, voxel_id, 1, ao[3], flip_id)
+        if flip_id:
+            order = (v1, v3, v0, v1, v2, v3)
+        else:
+            order = (v0, v2, v3, v0, v1, v2)
+
+    elif face_id == 2:
+        v0 = pack_data(x + 1, y    , z    , voxel_id, 2, ao[0], flip_id)
+        v1 = pack_data(x + 1, y + h, z    , voxel_id, 2, ao[1], flip_id)
+        v2 = pack_data(x + 1, y + h, z + w, voxel_id, 2, ao[2], flip_id)
+        v3 = pack_data(x + 1, y    , z + w, voxel_id, 2, ao[3], flip_id)
+        if flip_id:
+            order = (v3, v0, v1, v3, v1, v2)
+        else:
+            order = (v0, v1, v2, v0, v2, v3)
+
+    elif face_id == 3:
+        v0 = pack_data(x, y    , z    , voxel_id, 3, ao[0], flip_id)
+        v1 = pack_data(x, y + h, z    , voxel_id, 3, ao[1], flip_id)
+        v2 = pack_data(x, y + h, z + w, voxel_id, 3, ao[2], flip_id)
+        v3 = pack_data(x, y    , z + w, voxel_id, 3, ao[3], flip_id)
+        if flip_id:
+            order = (v3, v1, v0, v3, v2, v1)
+        else:
+            order = (v0, v2, v1, v0, v3, v2)
+
+    elif face_id == 4:
+        v0 = pack_data(x,     y,     z, voxel_id, 4, ao[0], flip_id)
+        v1 = pack_data(x,     y + h, z, voxel_id, 4, ao[1], flip_id)
+        v2 = pack_data(x + w, y + h, z, voxel_id, 4, ao[2], flip_id)
+        v3 = pack_data(x + w, y,     z, voxel_id, 4, ao[3], flip_id)
+        if flip_id:
+            order = (v3, v0, v1, v3, v1, v2)
+        else:
+            order = (v0, v1, v2, v0, v2, v3)
+
+    else:
+        v0 = pack_data(x    , y    , z + 1, voxel_id, 5, ao[0], flip_id)
+        v1 = pack_data(x    , y + h, z + 1, voxel_id, 5, ao[1], flip_id)
+        v2 = pack_data(x + w, y + h, z + 1, voxel_id, 5, ao[2], flip_id)
+        v3 = pack_data(x + w, y    , z + 1, voxel_id, 5, ao[3], flip_id)
+        if flip_id:
+            order = (v3, v1, v0, v3, v2, v1)
+        else:
+            order = (v0, v2, v1, v0, v3, v2)
+
+    # every vertex is followed by the quad size used to tile the texture
+    quad_size = w << 6 | h
+    for vertex in order:
+        index = add_data(vertex_data, index, vertex, quad_size)
+    return index
+
+
+@njit
+def get_face_key(padded_voxels, solid, exposed, face_id, x, y, z):
+    # voxel_id: 8bit  ao: 4 x 2bit  flip_id: 1bit  merge along u: 1bit  merge along v: 1bit, zero if hidden
+    r, bit = get_padded_row(y, z), x + 1
+    if not exposed[r] >> bit & 1:
+        return 0
+    voxel_id = padded_voxels[get_padded_index(x, y, z)]
+
+    if face_id == 0:
+        r += PADDED_SIZE
+    elif face_id == 1:
+        r -= PADDED_SIZE
+    elif face_id == 2:
+        bit += 1
+    elif face_id == 3:
+        bit -= 1
+    elif face_id == 4:
+        r -= 1
+    else:
+        r += 1
+
+    if not is_void(solid, r, bit):
+        return 0
+
+    if face_id < 2:
+        ao = get_ao(solid, r, bit, plane='Y')
+    elif face_id < 4:
+        ao = get_ao(solid, r, bit, plane='X')
+    else:
+        ao = get_ao(solid, r, bit, plane='Z')
+    flip_id = ao[1] + ao[3] > ao[0] + ao[2]
+
+    # faces can be merged along an axis when ao does not change along it
+    if face_id < 2:
+        along_u = ao[0] == ao[1] and ao[3] == ao[2]
+        along_v = ao[0] == ao[3] and ao[1] == ao[2]
+    else:
+        along_u = ao[0] == ao[3] and ao[1] == ao[2]
+        along_v = ao[0] == ao[1] and ao[3] == ao[2]
+
+    return (voxel_id | ao[0] << 8 | ao[1] << 10 | ao[2] << 12 | ao[3] << 14 | flip_id << 16 |
+            along_u << 17 | along_v << 18)
+
+
+@njit(nogil=True)
+def build_chunk_mesh_greedy(padded_voxels, solid, exposed, format_size, vertex_data, x0, y0, z0, size):
+    index = 0
+    if not is_section_exposed(exposed, x0, y0, z0, size):
+        return vertex_data[:index].copy()
+    mask = np.zeros((size, size), dtype='int32')
+
+    for face_id in range(6):
+        # slice axis s and texture axes u, v of the block
+        if face_id < 2:
+            s0, u0, v0 = y0, x0, z0
+        elif face_id < 4:
+            s0, u0, v0 = x0, z0, y0
+        else:
+            s0, u0, v0 = z0, x0, y0
+
+        for s in range(s0, s0 + size):
+            # visible faces of this slice
+            for i in range(size):
+                for j in range(size):
+                    u, v = u0 + i, v0 + j
+                    if face_id < 2:
+                        x, y, z = u, s, v
+                    elif face_id < 4:
+                        x, y, z = s, v, u
+                    else:
+                        x, y, z = u, v, s
+                    mask[i, j] = get_face_key(padded_voxels, solid, exposed, face_id, x, y, z)
+
+            # merge equal faces into rectangles
+            for i in range(size):
+                for j in range(size):
+                    key = mask[i, j]
+                    if not key:
+                        continue
+
+                    w, h = 1, 1
+                    if key >> 17 & 1:
+                        while i + w < size and mask[i + w, j] == key:
+                            w += 1
+                    if key >> 18 & 1:
+                        while j + h < size:
+                            row_matches = True
+                            for k in range(w):
+                                if mask[i + k, j + h] != key:
+                                    row_matches = False
+                                    break
+                            if not row_matches:
+                                break
+                            h += 1
+                    mask[i:i + w, j:j + h] = 0
+
+                    u, v = u0 + i, v0 + j
+                    if face_id < 2:
+                        x, y, z = u, s, v
+                    elif face_id < 4:
+                        x, y, z = s, v, u
+                    else:
+                        x, y, z = u, v, s
+                    voxel_id = key & 255
+                    ao = (key >> 8) & 3, (key >> 10) & 3, (key >> 12) & 3, (key >> 14) & 3
+                    flip_id = (key >> 16) & 1
+                    index = add_quad(vertex_data, index, face_id, x, y, z, w, h, voxel_id, ao, flip_id)
+
+    return vertex_data[:index].copy()
@@ -0,0 +1,225 @@
+from settings import *
+from numba import prange
+
+# voxel traversal straight on the voxel store pool, chunks without a dense buffer count as air
+
+BRICKS = CHUNK_SIZE // RAY_BRICK_SIZE
+BRICK_AREA = BRICKS * BRICKS
+BRICK_VOL = BRICK_AREA * BRICKS
+
+
+@njit(nogil=True, cache=True)
+def get_voxel(voxels, slots, x, y, z):
+    if not (0 <= x < WORLD_W * CHUNK_SIZE and 0 <= y < WORLD_H * CHUNK_SIZE and 0 <= z < WORLD_D * CHUNK_SIZE):
+        return 0
+    slot = slots[x // CHUNK_SIZE + WORLD_W * (z // CHUNK_SIZE) + WORLD_AREA * (y // CHUNK_SIZE)]
+    if slot == -1:
+        return 0
+    return voxels[slot, x % CHUNK_SIZE + CHUNK_SIZE * (z % CHUNK_SIZE) + CHUNK_AREA * (y % CHUNK_SIZE)]
+
+
+@njit(nogil=True, cache=True)
+def get_ray_chunks(x1, y1, z1, x2, y2, z2):
+    # loaded or not, every chunk in the bounding box of the ray
+    low_x = max(math.floor(min(x1, x2)) // CHUNK_SIZE, 0)
+    low_y = max(math.floor(min(y1, y2)) // CHUNK_SIZE, 0)
+    low_z = max(math.floor(min(z1, z2)) // CHUNK_SIZE, 0)
+    high_x = min(math.floor(max(x1, x2)) // CHUNK_SIZE, WORLD_W - 1)
+    high_y = min(math.floor(max(y1, y2)) // CHUNK_SIZE, WORLD_H - 1)
+    high_z = min(math.floor(max(z1, z2)) // CHUNK_SIZE, WORLD_D - 1)
+    chunk_indices = []
+    for y in range(low_y, high_y + 1):
+        for z in range(low_z, high_z + 1):
+            for x in range(low_x, high_x + 1):
+                chunk_indices.append(x + WORLD_W * z + WORLD_AREA * y)
+    return np.array(chunk_indices, dtype=np.int64)
+
+
+@njit(nogil=True, cache=True)
+def get_step(start, end):
+    # step direction, ray parameter per voxel and to the first voxel border along one axis
+    d = end - start
+    step = 1 if d > 0 else -1 if d < 0 else 0
+    delta = min(step / d, 10000000.0) if step != 0 else 10000000.0
+    fract = start - math.floor(start)
+    return step, delta, delta * (1.0 - fract) if step > 0 else delta * fract
+
+
+@njit(nogil=True, cache=True)
+def cast_ray(voxels, slots, x1, y1, z1, x2, y2, z2):
+    # dda from (x1, y1, z1) to (x2, y2, z2), returns (voxel id, x, y, z, normal x, y, z), voxel id 0 on a miss
+    x, y, z = int(math.floor(x1)), int(math.floor(y1)), int(math.floor(z1))
+    dx, delta_x, max_x = get_step(x1, x2)
+    dy, delta_y, max_y = get_step(y1, y2)
+    dz, delta_z, max_z = get_step(z1, z2)
+    step_dir = -1
+
+    while not (max_x > 1.0 and max_y > 1.0 and max_z > 1.0):
+        voxel_id = get_voxel(voxels, slots, x, y, z)
+        if voxel_id:
+            if step_dir == 0:
+                return voxel_id, x, y, z, -dx, 0, 0
+            if step_dir == 1:
+                return voxel_id, x, y, z, 0, -dy, 0
+            return voxel_id, x, y, z, 0, 0, -dz
+
+        if max_x < max_y:
+            if max_x < max_z:
+                x += dx
+                max_x += delta_x
+                step_dir = 0
+            else:
+                z += dz
+                max_z += delta_z
+                step_dir = 2
+        else:
+            if max_y < max_z:
+                y += dy
+                max_y += delta_y
+                step_dir = 1
+            else:
+                z += dz
+                max_z += delta_z
+                step_dir = 2
+    return 0, 0, 0, 0, 0, 0, 0
+
+
+@njit(nogil=True, cache=True)
+def fill_bricks(voxels, bricks):
+    # flags the bricks of a chunk that hold any solid voxel
+    bricks[:] = False
+    for y in range(CHUNK_SIZE):
+        for z in range(CHUNK_SIZE):
+            for x in range(CHUNK_SIZE):
+                if voxels[x + CHUNK_SIZE * z + CHUNK_AREA * y]:
+                    bricks[x // RAY_BRICK_SIZE + BRICKS * (z // RAY_BRICK_SIZE) + BRICK_AREA * (y // RAY_BRICK_SIZE)] = True
+
+
+@njit(nogil=True, cache=True)
+def get_exit(o, d, low, size):
+    # ray parameter where it leaves the cell [low, low + size) along one axis
+    if d > 0:
+        return (low + size - o) / d
+    if d < 0:
+        return (low - o) / d
+    return np.inf
+
+
+@njit(nogil=True, cache=True)
+def get_entry(o, d, size):
+    # ray parameters where it enters and leaves [0, size) along one axis
+    if d == 0:
+        return (-np.inf, np.inf) if 0 <= o < size else (np.inf, -np.inf)
+    t0, t1 = -o / d, (size - o) / d
+    return (t0, t1) if t0 < t1 else (t1, t0)
+
+
+@njit(nogil=True, cache=True)
+def cast_brick_ray(voxels, slots, solid, bricks, ox, oy, oz, dx, dy, dz, max_dist):
+    # like cast_ray with a normalized direction and a length, but crossing empty chunks and empty
+    # bricks in one step. returns (voxel id, x, y, z, normal x, y, z, chunk index), the chunk index
+    # is >= 0 if the ray reached solid bricks of a chunk without a dense buffer and was stopped there
+    size_x, size_y, size_z = WORLD_W * CHUNK_SIZE, WORLD_H * CHUNK_SIZE, WORLD_D * CHUNK_SIZE
+
+    # clip to the world box
+    t, t_far, axis = 0.0, max_dist, -1
+    t0, t1 = get_entry(ox, dx, size_x)
+    if t0 > t:
+        t, axis = t0, 0
+    t_far = min(t_far, t1)
+    t0, t1 = get_entry(oy, dy, size_y)
+    if t0 > t:
+        t, axis = t0, 1
+    t_far = min(t_far, t1)
+    t0, t1 = get_entry(oz, dz, size_z)
+    if t0 > t:
+        t, axis = t0, 2
+    t_far = min(t_far, t1)
+    if t > t_far:
+        return 0, 0, 0, 0, 0, 0, 0, -1
+    x = min(max(int(math.floor(ox + t * dx)), 0), size_x - 1)
+    y = min(max(int(math.floor(oy + t * dy)), 0), size_y - 1)
+    z = min(max(int(math.floor(oz + t * dz)), 0), size_z - 1)
+
+    while True:
+        chunk_index = x // CHUNK_SIZE + WORLD_W * (z // CHUNK_SIZE) + WORLD_AREA * (y // CHUNK_SIZE)
+        lx, ly, lz = x % CHUNK_SIZE, y % CHUNK_SIZE, z % CHUNK_SIZE
+        if not solid[chunk_index]:
+            size = CHUNK_SIZE
+        elif not bricks[chunk_index, lx // RAY_BRICK_SIZE + BRICKS * (lz // RAY_BRICK_SIZE) +
+                        BRICK_AREA * (ly // RAY_BRICK_SIZE)]:
+            size = RAY_BRICK_SIZE
+        else:
+            slot = slots[chunk_index]
+            if slot == -1:
+                return 0, 0, 0, 0, 0, 0, 0, chunk_index
+            voxel_id = voxels[slot, lx + CHUNK_SIZE * lz + CHUNK_AREA * ly]
+            if voxel_id:
+                nx = -int(np.sign(dx)) if axis == 0 else 0
+                ny = -int(np.sign(dy)) if axis == 1 else 0
+                nz = -int(np.sign(dz)) if axis == 2 else 0
+                return voxel_id, x, y, z, nx, ny, nz, -1
+            size = 1
+
+        # leave the cell of this size holding the current voxel
+        low_x, low_y, low_z = x - x % size, y - y % size, z - z % size
+        tx = get_exit(ox, dx, low_x, size)
+        ty = get_exit(oy, dy, low_y, size)
+        tz = get_exit(oz, dz, low_z, size)
+        if tx < ty and tx < tz:
+            t, axis = tx, 0
+        elif ty < tz:
+            t, axis = ty, 1
+        else:
+            t, axis = tz, 2
+        if t > t_far:
+            return 0, 0, 0, 0, 0, 0, 0, -1
+
+        # next voxel, clamped to the cell on the other axes against rounding
+        x = min(max(int(math.floor(ox + t * dx)), low_x), low_x + size - 1)
+        y = min(max(int(math.floor(oy + t * dy)), low_y), low_y + size - 1)
+        z = min(max(int(math.floor(oz + t * dz)), low_z), low_z + size - 1)
+        if axis == 0:
+            x = low_x + size if dx > 0 else low_x - 1
+        elif axis == 1:
+            y = low_y + size if dy > 0 else low_y - 1
+        else:
+            z = low_z + size if dz > 0 else low_z - 1
+        if not (0 <= x < size_x and 0 <= y < size_y and 0 <= z < size_z):
+            return 0, 0, 0, 0, 0, 0, 0, -1
+
+
+@njit(parallel=True, cache=True)
+def cast_brick_rays(voxels, slots, solid, bricks, origins, directions, max_dists, rays,
+                    voxel_ids, positions, normals, blocked):
+    # casts the rays listed in rays, results are written at their ray index
+    for i in prange(len(rays)):
+        r = rays[i]
+        voxel_id, x, y, z, nx, ny, nz, chunk_index = cast_brick_ray(
+            voxels, slots, solid, bricks, origins[r, 0], origins[r, 1], origins[r, 2],
+            directions[r, 0], directions[r, 1], directions[r, 2], max_dists[r])
+        voxel_ids[r] = voxel_id
+        positions[r, 0], positions[r, 1], positions[r, 2] = x, y, z
+        normals[r, 0], normals[r, 1], normals[r, 2] = nx, ny, nz
+        blocked[r] = chunk_index
+
+
+class BrickMap:
+    # per chunk solid flags and solid brick flags of the voxel store, refreshed from its chunk versions
+    def __init__(self, voxel_store):
+        self.voxel_store = voxel_store
+        self.solid = np.zeros(WORLD_VOL, dtype='bool')
+        self.bricks = np.zeros([WORLD_VOL, BRICK_VOL], dtype='bool')
+        self.versions = np.full(WORLD_VOL, -1, dtype='int64')
+
+    def update(self):
+        versions = self.voxel_store.versions
+        stale = np.flatnonzero(self.versions != versions)
+        for chunk_index in stale.tolist():
+            voxels = self.voxel_store.get_voxels(chunk_index)
+            if voxels is None:
+                self.bricks[chunk_index] = False
+            else:
+                fill_bricks(voxels, self.bricks[chunk_index])
+            self.solid[chunk_index] = self.bricks[chunk_index].any()
+        self.versions[stale] = versions[stale]
@@ -0,0 +1,155 @@
+import os
+import struct
+import threading
+import zlib
+import numpy as np
+from settings import *
+from world_data_handler import pack_chunk_to_bytes, unpack_chunk_from_bytes
+
+# region file layout:
+#   header: one (sector offset, sector count) uint32 pair per chunk slot, zero if the chunk is absent
+#   data:   sector aligned records of uint32 length + zlib compressed RLE bytes
+ENTRY_FMT = "<II"
+ENTRY_SIZE = struct.calcsize(ENTRY_FMT)
+RECORD_HEADER_FMT = "<I"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FMT)
+REGION_VOL = REGION_SIZE * REGION_SIZE * WORLD_H
+HEADER_SECTORS = -(-REGION_VOL * ENTRY_SIZE // SECTOR_SIZE)
+
+
+class RegionFile:
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        exists = path.exists()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+
+        if exists and os.fstat(self.fd).st_size >= HEADER_SECTORS * SECTOR_SIZE:
+            header = os.pread(self.fd, REGION_VOL * ENTRY_SIZE, 0)
+            self.entries = np.frombuffer(header, dtype='<u4').reshape(-1, 2).copy()
+        else:
+            self.entries = np.zeros([REGION_VOL, 2], dtype='<u4')
+            os.pwrite(self.fd, b'\x00' * HEADER_SECTORS * SECTOR_SIZE, 0)
+
+        # sector occupancy, header sectors are always taken
+        n_sectors = -(-os.fstat(self.fd).st_size // SECTOR_SIZE)
+        self.used = np.zeros(n_sectors, dtype=bool)
+        self.used[:HEADER_SECTORS] = True
+        for offset, count in self.entries:
+            self.used[offset:offset + count] = True
+
+    def read(self, local_index):
+        with self.lock:
+            offset, count = self.entries[local_index]
+            if not count:
+                return None
+            record = os.pread(self.fd, int(count) * SECTOR_SIZE, int(offset) * SECTOR_SIZE)
+        length = struct.unpack_from(RECORD_HEADER_FMT, record, 0)[0]
+        return zlib.decompress(record[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + length])
+
+    def write(self, local_index, data):
+        data = zlib.compress(data)
+        record = struct.pack(RECORD_HEADER_FMT, len(data)) + data
+        count = -(-len(record) // SECTOR_SIZE)
+        record += b'\x00' * (count * SECTOR_SIZE - len(record))
+
+        with self.lock:
+            old_offset, old_count = (int(v) for v in self.entries[local_index])
+            self.used[old_offset:old_offset + old_count] = False
+
+            # rewrite in place when it still fits, otherwise first fit or append
+            if old_count >= count:
+                offset = old_offset
+            else:
+                offset = self.find_free(count)
+            if offset + count > len(self.used):
+                self.used = np.concatenate([self.used, np.zeros(offset + count - len(self.used), dtype=bool)])
+            self.used[offset:offset + count] = True
+
+            os.pwrite(self.fd, record, offset * SECTOR_SIZE)
+            self.set_entry(local_index, offset, count)
+
+    def find_free(self, count):
+        run = 0
+        for sector in range(HEADER_SECTORS, len(self.used)):
+            run = 0 if self.used[sector] else run + 1
+            if run == count:
+                return sector - count + 1
+        # nothing large enough, append after the last used sector
+        return len(self.used) - run
+
+    def set_entry(self, local_index, offset, count):
+        self.entries[local_index] = offset, count
+        os.pwrite(self.fd, struct.pack(ENTRY_FMT, offset, count), local_index * ENTRY_SIZE)
+
+    def free_sectors(self):
+        return int(np.count_nonzero(~self.used))
+
+    def compact(self):
+        # pack all records back to back after the header and drop the gaps
+        with self.lock:
+            offset = HEADER_SECTORS
+            for local_index in np.argsort(self.entries[:, 0], kind='stable'):
+                old_offset, count = (int(v) for v in self.entries[local_index])
+                if not count:
+                    continue
+                if old_offset != offset:
+                    record = os.pread(self.fd, count * SECTOR_SIZE, old_offset * SECTOR_SIZE)
+                    os.pwrite(self.fd, record, offset * SECTOR_SIZE)
+                    self.set_entry(local_index, offset, count)
+                offset += count
+            os.ftruncate(self.fd, offset * SECTOR_SIZE)
+            self.used = np.ones(offset, dtype=bool)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class RegionStorage:
+    def __init__(self, base_dir: Path = CHUNK_FILE_BASE_DIR):
+        self.base_dir = base_dir
+        self.regions = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_location(chunk_index):
+        x, y, z = chunk_index % WORLD_W, chunk_index // WORLD_AREA, chunk_index % WORLD_AREA // WORLD_W
+        key = x // REGION_SIZE, z // REGION_SIZE
+        local_index = x % REGION_SIZE + REGION_SIZE * (z % REGION_SIZE) + REGION_SIZE * REGION_SIZE * y
+        return key, local_index
+
+    def get_region(self, key, create=False):
+        with self.lock:
+            region = self.regions.get(key)
+            if region is None:
+                path = self.base_dir / f'r.{key[0]}.{key[1]}{REGION_FILE_FORMAT}'
+                if not create and not path.exists():
+                    return None
+                self.base_dir.mkdir(parents=True, exist_ok=True)
+                region = self.regions[key] = RegionFile(path)
+            return region
+
+    def load_chunk(self, chunk_index):
+        key, local_index = self.get_location(chunk_index)
+        region = self.get_region(key)
+        if region is None:
+            return None
+        data = region.read(local_index)
+        if data is None:
+            return None
+        return unpack_chunk_from_bytes(data)
+
+    def save_chunk(self, chunk_index, voxels):
+        key, local_index = self.get_location(chunk_index)
+        self.get_region(key, create=True).write(local_index, pack_chunk_to_bytes(voxels))
+
+    def compact(self):
+        for region in list(self.regions.values()):
+            if region.free_sectors():
+                region.compact()
+
+    def close(self):
+        with self.lock:
+            for region in self.regions.values():
+                region.close()
+            self.regions.clear()
@@ -2,13 +2,27 @@ from numba import njit
 import numpy as np
 import glm
 import math
+import os
 import json
 from pathlib import Path
 RENDER_DISTANCE = 8
+# chunks are evicted only past this distance to avoid thrashing at the load border
+UNLOAD_DISTANCE = RENDER_DISTANCE + 4
+
+# chunk streaming
+STREAM_WORKERS = 4
+STREAM_BUDGET_MS = 4.0  # main thread time spent integrating loaded chunks per frame
+
+# chunks away from the player are kept palette packed, dense only while meshed or edited
+PACKED_CHUNKS = True
+PACK_BUDGET_MS = 2.0
 
 # File format
 CHUNK_FILE_FORMAT = ".json"
 CHUNK_FILE_BASE_DIR =  Path(f'world_data/chunks')
+REGION_FILE_FORMAT = ".region"
+REGION_SIZE = 8  # chunks per region along x and z, each region spans the full world height
+SECTOR_SIZE = 4096
 
 # OpenGL settings
 MAJOR_VER, MINOR_VER = 3, 3
@@ -20,9 +34,22 @@ WIN_RES = glm.vec2(1600, 900)
 
 # world generation
 SEED = 11405
+HEIGHTMAP_CACHE_SIZE = 1024  # chunk column height tiles kept in memory
+# cave noise lattice spacing in voxels, 1 samples every voxel exactly, a divisor of
+# CHUNK_SIZE samples every n voxels and interpolates (faster, caves change slightly)
+CAVE_NOISE_STEP = 1
+
+# meshing
+GREEDY_MESHING = False  # merge coplanar faces with equal voxel id and ao into larger quads
+MESH_WORKERS = os.cpu_count() or 1
+MESH_UPLOAD_BUDGET_MS = 4.0  # main thread time spent uploading finished meshes per frame
+REMESH_BUDGET_MS = 2.0  # main thread time spent starting queued remeshes per frame
+MESH_BATCH_SIZE = 256  # meshes in flight while building a whole world
+ARENA_VERTICES = 1 << 21  # initial size of the shared chunk vertex buffer, doubled when full
 
 # ray casting
 MAX_RAY_DIST = 6
+RAY_BRICK_SIZE = 8  # batched rays skip empty chunks and empty bricks of this size, a divisor of CHUNK_SIZE
 
 # chunk
 CHUNK_SIZE = 48
@@ -31,6 +58,17 @@ CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
 CHUNK_VOL = CHUNK_AREA * CHUNK_SIZE
 CHUNK_SPHERE_RADIUS = H_CHUNK_SIZE * math.sqrt(3)
 
+# chunk with a one voxel border copied from its neighbours, used for meshing
+PADDED_SIZE = CHUNK_SIZE + 2
+PADDED_AREA = PADDED_SIZE * PADDED_SIZE
+PADDED_VOL = PADDED_AREA * PADDED_SIZE
+
+# chunk meshes are built and drawn per section, an edit only remeshes the sections around it
+SECTION_SIZE = 16
+SECTIONS = CHUNK_SIZE // SECTION_SIZE
+SECTION_AREA = SECTIONS * SECTIONS
+SECTION_VOL = SECTION_AREA * SECTIONS
+
 # world
 WORLD_W, WORLD_H = 60, 3
 WORLD_D = WORLD_W
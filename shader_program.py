@@ -7,7 +7,10 @@ class ShaderProgram:
         self.ctx = engine.ctx
         self.player = engine.player
         # -------- shaders -------- #
-        self.chunk = self.get_program(shader_name='chunk')
+        # chunk origins come from the indirect draw commands where multi draw is available
+        chunk_defines = ('MULTI_DRAW',) if self.ctx.version_code >= 430 else ()
+        self.chunk = self.get_program(shader_name='chunk', defines=chunk_defines)
+        self.chunk_greedy = self.get_program(shader_name='chunk', defines=(*chunk_defines, 'GREEDY'))
         self.voxel_marker = self.get_program(shader_name='voxel_marker')
         self.water = self.get_program('water')
         self.clouds = self.get_program('clouds')
@@ -16,11 +19,11 @@ class ShaderProgram:
 
     def set_uniforms_on_init(self):
         # chunk
-        self.chunk['m_proj'].write(self.player.m_proj)
-        self.chunk['m_model'].write(glm.mat4())
-        self.chunk['u_texture_array_0'] = 1
-        self.chunk['bg_color'].write(BG_COLOR)
-        self.chunk['water_line'] = WATER_LINE
+        for program in (self.chunk, self.chunk_greedy):
+            program['m_proj'].write(self.player.m_proj)
+            program['u_texture_array_0'] = 1
+            program['bg_color'].write(BG_COLOR)
+            program['water_line'] = WATER_LINE
 
         # marker
         self.voxel_marker['m_proj'].write(self.player.m_proj)
@@ -41,16 +44,24 @@ class ShaderProgram:
 
     def update(self):
         self.chunk['m_view'].write(self.player.m_view)
+        self.chunk_greedy['m_view'].write(self.player.m_view)
         self.voxel_marker['m_view'].write(self.player.m_view)
         self.water['m_view'].write(self.player.m_view)
         self.clouds['m_view'].write(self.player.m_view)
 
-    def get_program(self, shader_name):
+    def get_program(self, shader_name, defines=()):
         with open(f'shaders/{shader_name}.vert') as file:
-            vertex_shader = file.read()
-
+            vertex_shader = self.add_defines(file.read(), defines)
         with open(f'shaders/{shader_name}.frag') as file:
-            fragment_shader = file.read()
+            fragment_shader = self.add_defines(file.read(), defines)
 
         program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
         return program
+
+    @staticmethod
+    def add_defines(shader, defines):
+        if not defines:
+            return shader
+        # defines go right after the #version line
+        version, source = shader.split('\n', 1)
+        return '\n'.join([version, *(f'#define {name}' for name in defines), source])
@@ -19,7 +19,11 @@ flat in int voxel_id;
 
 void main() {
     vec2 face_uv = uv;
+#ifdef GREEDY
+    face_uv.x = fract(uv.x) / 3.0 - min(face_id, 2) / 3.0;
+#else
     face_uv.x = uv.x / 3.0 - min(face_id, 2) / 3.0;
+#endif
 
     vec3 tex_col = texture(u_texture_array_0, vec3(face_uv, voxel_id)).rgb;
     tex_col = pow(tex_col, gamma);
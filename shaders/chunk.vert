@@ -1,6 +1,9 @@
 #version 330 core
 
 layout (location = 0) in uint packed_data;
+#ifdef GREEDY
+layout (location = 1) in uint packed_size;
+#endif
 
 int x, y, z;
 int ao_id;
@@ -8,7 +11,13 @@ int flip_id;
 
 uniform mat4 m_proj;
 uniform mat4 m_view;
-uniform mat4 m_model;
+
+// chunk position, per draw as an instanced attribute with multi draw, a uniform otherwise
+#ifdef MULTI_DRAW
+in vec3 chunk_origin;
+#else
+uniform vec3 chunk_origin;
+#endif
 
 flat out int voxel_id;
 flat out int face_id;
@@ -75,10 +84,14 @@ void main() {
     int uv_index = gl_VertexID % 6  + ((face_id & 1) + flip_id * 2) * 6;
 
     uv = uv_coords[uv_indices[uv_index]];
+#ifdef GREEDY
+    // merged quads repeat the texture once per voxel face
+    uv *= vec2(packed_size >> 6u, packed_size & 63u);
+#endif
 
     shading = face_shading[face_id] * ao_values[ao_id];
 
-    frag_world_pos = (m_model * vec4(in_position, 1.0)).xyz;
+    frag_world_pos = in_position + chunk_origin;
 
     gl_Position = m_proj * m_view * vec4(frag_world_pos, 1.0);
 }
@@ -1,7 +1,13 @@
-from noise import noise2, noise3
-from random import random
+from noise import noise2
+from batch_noise import noise2_grid, fbm2_grid, fbm3_block, fbm3_block_lerp
+from numba import prange
 from settings import *
 
+# separate hash streams for every random decision, see hash_random
+SALT_SURFACE = 1
+SALT_TREE = 2
+SALT_LEAVES = 3
+
 
 @njit
 def get_height(x, z):
@@ -32,25 +38,67 @@ def get_height(x, z):
     return int(height)
 
 
+@njit(nogil=True)
+def get_height_tile(out, x0, z0):
+    # get_height for every column of out, with each octave evaluated as a whole grid
+    a1 = CENTER_Y
+    a2, a4, a8 = a1 * 0.5, a1 * 0.25, a1 * 0.125
+    f1 = 0.005
+    f8 = f1 * 8
+
+    shape = out.shape
+    mask = np.empty(shape)
+    noise2_grid(mask, x0, z0, 0.1)
+    height = np.empty(shape)
+    noise2_grid(height, x0, z0, f1)
+    for x in range(shape[0]):
+        for z in range(shape[1]):
+            a = a1 / 1.07 if mask[x, z] < 0 else a1
+            height[x, z] = height[x, z] * a + a
+
+    fbm2_grid(height, x0, z0, f1 * 2, np.array([a2, a4, a8]), np.array([-a2, a4, -a8]))
+    floor = np.empty(shape)
+    noise2_grid(floor, x0, z0, f8)
+    for x in range(shape[0]):
+        for z in range(shape[1]):
+            out[x, z] = int(max(height[x, z], floor[x, z] + 2))
+
+
 @njit
 def get_index(x, y, z):
     return x + CHUNK_SIZE * z + CHUNK_AREA * y
 
 
 @njit
-def set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height):
+def hash_random(wx, wy, wz, salt):
+    # stateless random in [0, 1) from the world seed and a voxel position,
+    # the same voxel always gets the same value whatever chunk or thread generates it
+    h = (wx * 73856093) ^ (wy * 19349663) ^ (wz * 83492791) ^ (salt * 2654435761) ^ SEED
+    h &= 0xFFFFFFFF
+    h = ((h >> 16) ^ h) * 0x45D9F3B & 0xFFFFFFFF
+    h = ((h >> 16) ^ h) * 0x45D9F3B & 0xFFFFFFFF
+    h = (h >> 16) ^ h
+    return h / 4294967296.0
+
+
+@njit
+def is_cave(wy, world_height, cave_floor, cave_noise):
+    return cave_floor < wy < world_height - 10 and cave_noise > 0
+
+
+@njit
+def set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height, cave):
     voxel_id = 0
 
     if wy < world_height - 1:
         # create caves
-        if (noise3(wx * 0.09, wy * 0.09, wz * 0.09) > 0 and
-                noise2(wx * 0.1, wz * 0.1) * 3 + 3 < wy < world_height - 10):
+        if cave:
             voxel_id = 0
 
         else:
             voxel_id = STONE
     else:
-        rng = int(7 * random())
+        rng = int(7 * hash_random(wx, wy, wz, SALT_SURFACE))
         ry = wy - rng
         if SNOW_LVL <= ry < world_height:
             voxel_id = SNOW
@@ -72,12 +120,12 @@ def set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height):
 
     # place tree
     if wy < DIRT_LVL:
-        place_tree(voxels, x, y, z, voxel_id)
+        place_tree(voxels, x, y, z, wx, wy, wz, voxel_id)
 
 
 @njit
-def place_tree(voxels, x, y, z, voxel_id):
-    rnd = random()
+def place_tree(voxels, x, y, z, wx, wy, wz, voxel_id):
+    rnd = hash_random(wx, wy, wz, SALT_TREE)
     if voxel_id != GRASS or rnd > TREE_PROBABILITY:
         return None
     if y + TREE_HEIGHT >= CHUNK_SIZE:
@@ -94,7 +142,7 @@ def place_tree(voxels, x, y, z, voxel_id):
     m = 0
     for n, iy in enumerate(range(TREE_H_HEIGHT, TREE_HEIGHT - 1)):
         k = iy % 2
-        rng = int(random() * 2)
+        rng = int(hash_random(wx, wy + iy, wz, SALT_LEAVES) * 2)
         for ix in range(-TREE_H_WIDTH + m, TREE_H_WIDTH - m * rng):
             for iz in range(-TREE_H_WIDTH + m * rng, TREE_H_WIDTH - m):
                 if (ix + iz) % 4:
@@ -107,3 +155,51 @@ def place_tree(voxels, x, y, z, voxel_id):
 
     # top
     voxels[get_index(x, y + TREE_HEIGHT - 2, z)] = LEAVES
+
+
+@njit(nogil=True)
+def generate_terrain(voxels, cx, cy, cz, heights, cave_step=CAVE_NOISE_STEP):
+    if heights.max() <= cy:
+        return
+
+    # caves are carved between a noisy floor and 10 voxels under the surface,
+    # cave noise is only evaluated for that band of every column
+    cave_floor = np.full((CHUNK_SIZE, CHUNK_SIZE), np.inf)
+    if heights.max() - 10 > cy:
+        noise2_grid(cave_floor, cx, cz, 0.1)
+    y_start = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.int64)
+    y_stop = np.zeros((CHUNK_SIZE, CHUNK_SIZE), dtype=np.int64)
+    for x in range(CHUNK_SIZE):
+        for z in range(CHUNK_SIZE):
+            cave_floor[x, z] = cave_floor[x, z] * 3 + 3
+            if cave_floor[x, z] < CHUNK_SIZE + cy:
+                y_start[x, z] = max(math.floor(cave_floor[x, z]) + 1 - cy, 0)
+            else:
+                y_start[x, z] = CHUNK_SIZE
+            y_stop[x, z] = max(y_start[x, z], min(heights[x, z] - 10 - cy, CHUNK_SIZE))
+    cave_noise = np.zeros((CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+    if cave_step > 1:
+        fbm3_block_lerp(cave_noise, cx, cy, cz, 0.09, np.ones(1), y_start, y_stop, cave_step)
+    else:
+        fbm3_block(cave_noise, cx, cy, cz, 0.09, np.ones(1), y_start, y_stop)
+
+    for x in range(CHUNK_SIZE):
+        wx = x + cx
+        for z in range(CHUNK_SIZE):
+            wz = z + cz
+            world_height = heights[x, z]
+            local_height = min(world_height - cy, CHUNK_SIZE)
+
+            for y in range(local_height):
+                wy = y + cy
+                cave = is_cave(wy, world_height, cave_floor[x, z], cave_noise[x, z, y])
+                set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height, cave)
+
+
+@njit(parallel=True)
+def generate_terrain_batch(voxels, slots, positions, heights, tile_ids):
+    # fills voxels[slots[i]] with the chunk at positions[i] (chunk coordinates) using
+    # the height tile heights[tile_ids[i]] of its column, one chunk per thread
+    for i in prange(len(slots)):
+        cx, cy, cz = positions[i, 0], positions[i, 1], positions[i, 2]
+        generate_terrain(voxels[slots[i]], cx * CHUNK_SIZE, cy * CHUNK_SIZE, cz * CHUNK_SIZE, heights[tile_ids[i]])
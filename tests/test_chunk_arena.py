@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+from meshes.chunk_arena import ArenaAllocator
+
+
+def check_invariants(allocator):
+    # free blocks sorted, merged, inside the capacity and disjoint from the live blocks
+    free = list(zip(allocator.free_offsets, allocator.free_sizes))
+    assert all(size > 0 for _, size in free)
+    for (offset, size), (next_offset, _) in zip(free, free[1:]):
+        assert offset + size < next_offset
+
+    spans = sorted(free + list(allocator.blocks.values()))
+    end = 0
+    for offset, size in spans:
+        assert offset == end
+        end = offset + size
+    assert end == allocator.capacity
+
+
+def test_first_fit_takes_the_lowest_hole():
+    allocator = ArenaAllocator(100)
+    for key in 'abcd':
+        allocator.alloc(key, 10)
+    allocator.release('a')
+    allocator.release('c')
+
+    assert allocator.alloc('e', 5) == 0
+    assert allocator.alloc('f', 10) == 20
+    assert allocator.alloc('g', 8) == 40
+    check_invariants(allocator)
+
+
+def test_alloc_returns_none_when_nothing_fits():
+    allocator = ArenaAllocator(30)
+    allocator.alloc('a', 10)
+    allocator.alloc('b', 10)
+    allocator.alloc('c', 10)
+    allocator.release('b')
+
+    assert allocator.alloc('d', 11) is None
+    assert 'd' not in allocator
+    check_invariants(allocator)
+
+
+def test_exact_fit_removes_the_free_block():
+    allocator = ArenaAllocator(30)
+    allocator.alloc('a', 10)
+    allocator.alloc('b', 10)
+    allocator.alloc('c', 10)
+    allocator.release('b')
+
+    assert allocator.alloc('d', 10) == 10
+    assert allocator.free_offsets == [] and allocator.free_sizes == []
+    check_invariants(allocator)
+
+
+def test_release_merges_with_both_neighbours():
+    allocator = ArenaAllocator(40)
+    for key in 'abcd':
+        allocator.alloc(key, 10)
+    allocator.release('a')
+    allocator.release('c')
+    assert allocator.free_offsets == [0, 20]
+
+    allocator.release('b')
+    assert allocator.free_offsets == [0] and allocator.free_sizes == [30]
+    check_invariants(allocator)
+
+
+def test_release_merges_with_the_tail():
+    allocator = ArenaAllocator(40)
+    allocator.alloc('a', 10)
+    allocator.alloc('b', 10)
+    allocator.release('b')
+
+    assert allocator.free_offsets == [10] and allocator.free_sizes == [30]
+    check_invariants(allocator)
+
+
+def test_empty_blocks_are_rejected():
+    allocator = ArenaAllocator(10)
+    with pytest.raises(ValueError):
+        allocator.alloc('a', 0)
+    assert 'a' not in allocator
+    check_invariants(allocator)
+
+
+def test_compact_into_a_larger_capacity():
+    allocator = ArenaAllocator(40)
+    for key in 'abcd':
+        allocator.alloc(key, 10)
+    allocator.release('a')
+    allocator.release('c')
+
+    moves = allocator.compact(80)
+    assert moves == [('b', 10, 0, 10), ('d', 30, 10, 10)]
+    assert allocator.blocks == {'b': (0, 10), 'd': (10, 10)}
+    assert allocator.capacity == 80
+    assert allocator.free_offsets == [20] and allocator.free_sizes == [60]
+    check_invariants(allocator)
+
+
+def test_failed_compact_leaves_the_allocator_unchanged():
+    allocator = ArenaAllocator(40)
+    allocator.alloc('a', 10)
+    allocator.alloc('b', 20)
+    allocator.release('a')
+    blocks, free = dict(allocator.blocks), (list(allocator.free_offsets), list(allocator.free_sizes))
+
+    with pytest.raises(ValueError):
+        allocator.compact(15)
+    assert allocator.blocks == blocks
+    assert (allocator.free_offsets, allocator.free_sizes) == free
+    assert allocator.capacity == 40
+    check_invariants(allocator)
+
+
+def test_accounting():
+    allocator = ArenaAllocator(100)
+    assert (allocator.used, allocator.free, allocator.largest_free) == (0, 100, 100)
+
+    allocator.alloc('a', 30)
+    allocator.alloc('b', 20)
+    allocator.alloc('c', 10)
+    allocator.release('b')
+    assert (allocator.used, allocator.free, allocator.largest_free) == (40, 60, 40)
+
+    allocator.alloc('d', 40)
+    assert (allocator.used, allocator.free, allocator.largest_free) == (80, 20, 20)
+
+
+def test_random_operations_keep_the_invariants():
+    rng = random.Random(0)
+    allocator = ArenaAllocator(2000)
+    for step in range(20000):
+        action = rng.random()
+        if action < 0.55:
+            size = rng.randrange(200)
+            if not size:
+                with pytest.raises(ValueError):
+                    allocator.alloc(step, size)
+            elif allocator.alloc(step, size) is None:
+                assert allocator.largest_free < size
+        elif action < 0.98 and allocator.blocks:
+            allocator.release(rng.choice(list(allocator.blocks)))
+        else:
+            allocator.compact(max(allocator.capacity, allocator.used + rng.randrange(500)))
+        check_invariants(allocator)
+
+
+def test_rename_keeps_the_block():
+    allocator = ArenaAllocator(30)
+    allocator.alloc('a', 10)
+    allocator.alloc('b', 10)
+    allocator.release('a')
+    allocator.rename('b', 'a')
+
+    assert allocator.blocks == {'a': (10, 10)}
+    assert allocator.free_offsets == [0, 20]
+    check_invariants(allocator)
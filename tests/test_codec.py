@@ -0,0 +1,57 @@
+import struct
+
+import numpy as np
+import pytest
+
+from settings import CHUNK_SIZE, CHUNK_VOL, WORLD_D, WORLD_W
+from heightmap import HeightmapCache
+from terrain_gen import generate_terrain
+from world_data_handler import RUN_FMT, RUN_SIZE, pack_chunk_to_bytes, unpack_chunk_from_bytes
+
+
+def pack_chunk_to_bytes_struct(chunk_voxels):
+    # the original run by run encoder, the file format must not change
+    parts = []
+    curr, cnt = int(chunk_voxels[0]), 1
+    for v in chunk_voxels[1:].tolist():
+        if v == curr:
+            cnt += 1
+        else:
+            parts.append(struct.pack(RUN_FMT, cnt, curr))
+            curr, cnt = v, 1
+    parts.append(struct.pack(RUN_FMT, cnt, curr))
+    return b''.join(parts)
+
+
+def get_terrain_chunk():
+    voxels = np.zeros(CHUNK_VOL, dtype='uint8')
+    x, z = WORLD_W // 2, WORLD_D // 2
+    generate_terrain(voxels, x * CHUNK_SIZE, 0, z * CHUNK_SIZE, HeightmapCache().get(x, z))
+    return voxels
+
+
+CHUNKS = {
+    'air': lambda: np.zeros(CHUNK_VOL, dtype='uint8'),
+    'solid': lambda: np.full(CHUNK_VOL, 7, dtype='uint8'),
+    'alternating': lambda: np.tile(np.array([1, 2], dtype='uint8'), CHUNK_VOL // 2),
+    'terrain': get_terrain_chunk,
+}
+
+
+@pytest.mark.parametrize('name', CHUNKS)
+def test_round_trip(name):
+    voxels = CHUNKS[name]()
+    data = pack_chunk_to_bytes(voxels)
+    assert np.array_equal(unpack_chunk_from_bytes(data), voxels)
+    assert np.array_equal(unpack_chunk_from_bytes(memoryview(data)), voxels)
+
+
+@pytest.mark.parametrize('name', CHUNKS)
+def test_bytes_match_the_struct_encoder(name):
+    voxels = CHUNKS[name]()
+    assert pack_chunk_to_bytes(voxels) == pack_chunk_to_bytes_struct(voxels)
+
+
+def test_run_counts():
+    assert len(pack_chunk_to_bytes(CHUNKS['air']())) == RUN_SIZE
+    assert len(pack_chunk_to_bytes(CHUNKS['alternating']())) == CHUNK_VOL * RUN_SIZE
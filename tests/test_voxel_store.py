@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from settings import CHUNK_VOL
+from voxel_store import PalettedChunk
+
+
+def make_voxels(ids, seed=0):
+    # every id at least once, the rest random
+    rng = np.random.default_rng(seed)
+    voxels = rng.choice(np.array(ids, dtype='uint8'), CHUNK_VOL)
+    voxels[:len(ids)] = ids
+    return voxels
+
+
+def check_packed(packed, voxels):
+    assert np.array_equal(packed.to_dense(), voxels)
+    indices = np.array([0, 1, 31, 32, 777, CHUNK_VOL - 1])
+    assert np.array_equal(packed.take(indices), voxels[indices])
+    assert all(packed.get(i) == voxels[i] for i in indices.tolist())
+
+
+@pytest.mark.parametrize('ids, bits', [
+    ([0], 0),
+    ([7], 0),
+    ([0, 3], 1),
+    ([0, 1, 2, 9], 2),
+    (list(range(10, 26)), 4),
+    (list(range(1, 200)), 8),
+])
+def test_set_keeps_the_bits_while_the_palette_fits(ids, bits):
+    voxels = make_voxels(ids)
+    packed = PalettedChunk.from_dense(voxels)
+    assert packed.bits == bits
+
+    rng = np.random.default_rng(1)
+    for voxel_index in rng.integers(CHUNK_VOL, size=200).tolist():
+        voxel_id = ids[rng.integers(len(ids))]
+        packed.set(voxel_index, voxel_id)
+        voxels[voxel_index] = voxel_id
+    assert packed.bits == bits
+    check_packed(packed, voxels)
+
+
+def test_set_same_id_on_a_uniform_chunk():
+    packed = PalettedChunk.from_dense(np.zeros(CHUNK_VOL, dtype='uint8'))
+    packed.set(5, 0)
+    assert packed.bits == 0 and len(packed.words) == 0
+    check_packed(packed, np.zeros(CHUNK_VOL, dtype='uint8'))
+
+
+@pytest.mark.parametrize('ids, bits, new_bits', [
+    ([0], 0, 1),
+    ([0, 3], 1, 2),
+    ([0, 1, 2, 9], 2, 4),
+    (list(range(10, 26)), 4, 8),
+])
+def test_set_repacks_when_the_palette_overflows(ids, bits, new_bits):
+    voxels = make_voxels(ids)
+    packed = PalettedChunk.from_dense(voxels)
+    assert packed.bits == bits
+
+    packed.set(100, 255)
+    voxels[100] = 255
+    assert packed.bits == new_bits
+    check_packed(packed, voxels)
+
+
+def test_set_adds_ids_until_the_palette_is_full():
+    # a 2 bit chunk built from 3 ids takes a fourth id without repacking
+    voxels = make_voxels([0, 1, 2])
+    packed = PalettedChunk.from_dense(voxels)
+    assert packed.bits == 2
+
+    packed.set(10, 4)
+    voxels[10] = 4
+    assert packed.bits == 2 and len(packed.palette) == 4
+    check_packed(packed, voxels)
+
+    packed.set(11, 5)
+    voxels[11] = 5
+    assert packed.bits == 4
+    check_packed(packed, voxels)
@@ -1,10 +1,11 @@
 from settings import *
-from meshes.chunk_mesh_builder import get_chunk_index
+from ray_cast import cast_ray, get_ray_chunks, cast_brick_rays, BrickMap
 
 
 class VoxelHandler:
     def __init__(self, world):
         self.engine = world.engine
+        self.world = world
         self.chunks = world.chunks
 
         # ray casting result
@@ -15,6 +16,13 @@ class VoxelHandler:
         self.voxel_world_pos = None
         self.voxel_normal = None
 
+        # ray, chunks in its reach and their versions of the cached result
+        self.ray_key = None
+        self.ray_chunks = None
+        self.ray_versions = None
+        # empty chunk and brick flags for batched rays
+        self.brick_map = BrickMap(world.voxel_store)
+
         self.interaction_mode = 0  # 0: remove voxel   1: add voxel
         self.new_voxel_id = WOOD
         
@@ -25,45 +33,13 @@ class VoxelHandler:
 
             # is the new place empty?
             if not result[0]:
-                _, voxel_index, _, chunk = result
-                chunk.voxels[voxel_index] = self.new_voxel_id
-                chunk.mesh.rebuild()
-
-                # was it an empty chunk
-                if chunk.is_empty:
-                    chunk.is_empty = False
-
-    def rebuild_adj_chunk(self, adj_voxel_pos):
-        index = get_chunk_index(adj_voxel_pos)
-        if index != -1:
-            self.chunks[index].mesh.rebuild()
-
-    def rebuild_adjacent_chunks(self):
-        lx, ly, lz = self.voxel_local_pos
-        wx, wy, wz = self.voxel_world_pos
-
-        if lx == 0:
-            self.rebuild_adj_chunk((wx - 1, wy, wz))
-        elif lx == CHUNK_SIZE - 1:
-            self.rebuild_adj_chunk((wx + 1, wy, wz))
-
-        if ly == 0:
-            self.rebuild_adj_chunk((wx, wy - 1, wz))
-        elif ly == CHUNK_SIZE - 1:
-            self.rebuild_adj_chunk((wx, wy + 1, wz))
-
-        if lz == 0:
-            self.rebuild_adj_chunk((wx, wy, wz - 1))
-        elif lz == CHUNK_SIZE - 1:
-            self.rebuild_adj_chunk((wx, wy, wz + 1))
+                with self.world.edit() as edit:
+                    edit.set(tuple(self.voxel_world_pos + self.voxel_normal), self.new_voxel_id)
 
     def remove_voxel(self):
         if self.voxel_id:
-            print("HEHE")
-            self.chunk.voxels[self.voxel_index] = 0
-
-            self.chunk.mesh.rebuild()
-            self.rebuild_adjacent_chunks()
+            with self.world.edit() as edit:
+                edit.set(tuple(self.voxel_world_pos), 0)
 
     def set_voxel(self):
         if self.interaction_mode:
@@ -79,61 +55,65 @@ class VoxelHandler:
 
     def ray_cast(self):
         # start point
-        x1, y1, z1 = self.engine.player.position
+        x1, y1, z1 = position = self.engine.player.position
         # end point
-        x2, y2, z2 = self.engine.player.position + self.engine.player.forward * MAX_RAY_DIST
-
-        current_voxel_pos = glm.ivec3(x1, y1, z1)
-        self.voxel_id = 0
-        self.voxel_normal = glm.ivec3(0)
-        step_dir = -1
-
-        dx = glm.sign(x2 - x1)
-        delta_x = min(dx / (x2 - x1), 10000000.0) if dx != 0 else 10000000.0
-        max_x = delta_x * (1.0 - glm.fract(x1)) if dx > 0 else delta_x * glm.fract(x1)
-
-        dy = glm.sign(y2 - y1)
-        delta_y = min(dy / (y2 - y1), 10000000.0) if dy != 0 else 10000000.0
-        max_y = delta_y * (1.0 - glm.fract(y1)) if dy > 0 else delta_y * glm.fract(y1)
-
-        dz = glm.sign(z2 - z1)
-        delta_z = min(dz / (z2 - z1), 10000000.0) if dz != 0 else 10000000.0
-        max_z = delta_z * (1.0 - glm.fract(z1)) if dz > 0 else delta_z * glm.fract(z1)
-
-        while not (max_x > 1.0 and max_y > 1.0 and max_z > 1.0):
-
-            result = self.get_voxel_id(voxel_world_pos=current_voxel_pos)
-            if result[0]:
-                self.voxel_id, self.voxel_index, self.voxel_local_pos, self.chunk = result
-                self.voxel_world_pos = current_voxel_pos
-
-                if step_dir == 0:
-                    self.voxel_normal.x = -dx
-                elif step_dir == 1:
-                    self.voxel_normal.y = -dy
-                else:
-                    self.voxel_normal.z = -dz
-                return True
-
-            if max_x < max_y:
-                if max_x < max_z:
-                    current_voxel_pos.x += dx
-                    max_x += delta_x
-                    step_dir = 0
-                else:
-                    current_voxel_pos.z += dz
-                    max_z += delta_z
-                    step_dir = 2
-            else:
-                if max_y < max_z:
-                    current_voxel_pos.y += dy
-                    max_y += delta_y
-                    step_dir = 1
-                else:
-                    current_voxel_pos.z += dz
-                    max_z += delta_z
-                    step_dir = 2
-        return False
+        x2, y2, z2 = end = self.engine.player.position + self.engine.player.forward * MAX_RAY_DIST
+
+        # the last result holds while the ray and the chunks it can reach are unchanged
+        voxel_store = self.world.voxel_store
+        key = tuple(position), tuple(end)
+        if key != self.ray_key:
+            self.ray_key = key
+            self.ray_chunks = get_ray_chunks(x1, y1, z1, x2, y2, z2)
+        elif np.array_equal(voxel_store.versions[self.ray_chunks], self.ray_versions):
+            return bool(self.voxel_id)
+        self.ray_versions = voxel_store.versions[self.ray_chunks]
+
+        # the kernel reads dense buffers only, chunks without one are air
+        for chunk_index in self.ray_chunks.tolist():
+            if voxel_store.get_uniform(chunk_index) != 0:
+                voxel_store.expand(chunk_index)
+
+        voxel_id, x, y, z, nx, ny, nz = cast_ray(voxel_store.voxels, voxel_store.slots, x1, y1, z1, x2, y2, z2)
+        self.voxel_id = voxel_id
+        if not voxel_id:
+            self.voxel_normal = glm.ivec3(0)
+            return False
+
+        self.voxel_world_pos = glm.ivec3(x, y, z)
+        self.voxel_normal = glm.ivec3(nx, ny, nz)
+        self.voxel_local_pos = self.voxel_world_pos % CHUNK_SIZE
+        lx, ly, lz = self.voxel_local_pos
+        self.voxel_index = lx + CHUNK_SIZE * lz + CHUNK_AREA * ly
+        cx, cy, cz = self.voxel_world_pos // CHUNK_SIZE
+        self.chunk = self.chunks[cx + WORLD_W * cz + WORLD_AREA * cy]
+        return True
+
+    def cast_rays(self, origins, directions, max_dist=MAX_RAY_DIST):
+        # many rays at once, origins and directions (n, 3) and one length for all or one per ray.
+        # returns voxel ids (0 on a miss), hit voxel positions and the normals of the faces hit
+        origins = np.ascontiguousarray(origins, dtype='float64').reshape(-1, 3)
+        directions = np.asarray(directions, dtype='float64').reshape(-1, 3)
+        directions = directions / np.maximum(np.linalg.norm(directions, axis=1, keepdims=True), 1e-12)
+        n = len(origins)
+        max_dists = np.ascontiguousarray(np.broadcast_to(np.asarray(max_dist, dtype='float64'), n))
+
+        voxel_ids = np.zeros(n, dtype='uint8')
+        positions = np.zeros([n, 3], dtype='int64')
+        normals = np.zeros([n, 3], dtype='int64')
+        blocked = np.full(n, -1, dtype='int64')
+
+        voxel_store = self.world.voxel_store
+        self.brick_map.update()
+        rays = np.arange(n)
+        while len(rays):
+            cast_brick_rays(voxel_store.voxels, voxel_store.slots, self.brick_map.solid, self.brick_map.bricks,
+                            origins, directions, max_dists, rays, voxel_ids, positions, normals, blocked)
+            # rays that reached solid bricks of packed chunks run again once those are dense
+            rays = rays[blocked[rays] != -1]
+            for chunk_index in np.unique(blocked[rays]).tolist():
+                voxel_store.expand(chunk_index)
+        return voxel_ids, positions, normals
 
     def get_voxel_id(self, voxel_world_pos):
         cx, cy, cz = chunk_pos = voxel_world_pos / CHUNK_SIZE
@@ -145,7 +125,7 @@ class VoxelHandler:
                 lx, ly, lz = voxel_local_pos = voxel_world_pos - chunk_pos * CHUNK_SIZE
 
                 voxel_index = lx + CHUNK_SIZE * lz + CHUNK_AREA * ly
-                voxel_id = chunk.voxels[voxel_index]
+                voxel_id = self.world.voxel_store.get_voxel(chunk_index, voxel_index)
 
                 return voxel_id, voxel_index, voxel_local_pos, chunk
         return 0, 0, 0, 0
@@ -0,0 +1,346 @@
+from settings import *
+import time
+
+PALETTE_BITS = (0, 1, 2, 4, 8)
+
+# (padded, chunk) ranges along one axis for the neighbour below, the chunk itself and the one above
+PADDED_RANGES = {
+    -1: (slice(0, 1), slice(CHUNK_SIZE - 1, CHUNK_SIZE)),
+    0: (slice(1, CHUNK_SIZE + 1), slice(0, CHUNK_SIZE)),
+    1: (slice(CHUNK_SIZE + 1, CHUNK_SIZE + 2), slice(0, 1)),
+}
+AXIS = np.arange(CHUNK_SIZE)
+
+# chunk faces in mesh face order: top, bottom, right, left, back, front, the opposite face is face ^ 1
+FACE_OFFSETS = ((0, 1, 0), (0, -1, 0), (1, 0, 0), (-1, 0, 0), (0, 0, -1), (0, 0, 1))
+ALL_FACES = (1 << len(FACE_OFFSETS)) - 1
+FULL_ROW = (1 << CHUNK_SIZE) - 1
+
+
+@njit(nogil=True, cache=True)
+def fill_occupancy(voxels, rows):
+    # rows[z + CHUNK_SIZE * y] gets the solid bits of the voxels along x.
+    # returns the id of a uniform chunk or -1, and the bits of the faces that are fully solid
+    uniform = True
+    for r in range(CHUNK_AREA):
+        bits = 0
+        for x in range(CHUNK_SIZE):
+            voxel_id = voxels[x + CHUNK_SIZE * r]
+            if voxel_id:
+                bits |= 1 << x
+            if voxel_id != voxels[0]:
+                uniform = False
+        rows[r] = bits
+
+    top = bottom = right = left = back = front = True
+    for y in range(CHUNK_SIZE):
+        for z in range(CHUNK_SIZE):
+            bits = rows[z + CHUNK_SIZE * y]
+            right = right and bits >> (CHUNK_SIZE - 1) & 1 == 1
+            left = left and bits & 1 == 1
+            if y == 0:
+                bottom = bottom and bits == FULL_ROW
+            if y == CHUNK_SIZE - 1:
+                top = top and bits == FULL_ROW
+            if z == 0:
+                back = back and bits == FULL_ROW
+            if z == CHUNK_SIZE - 1:
+                front = front and bits == FULL_ROW
+    opaque = top | bottom << 1 | right << 2 | left << 3 | back << 4 | front << 5
+    return voxels[0] if uniform else -1, opaque
+
+
+class PalettedChunk:
+    # chunk voxels as a small palette of ids plus bit packed palette indices
+    def __init__(self, palette, words):
+        self.palette = palette
+        self.words = words
+
+    @classmethod
+    def from_dense(cls, voxels):
+        palette = np.flatnonzero(np.bincount(voxels, minlength=256)).astype('uint8')
+        bits = next(bits for bits in PALETTE_BITS if len(palette) <= 1 << bits)
+        if not bits:
+            return cls(palette, np.empty(0, dtype='uint32'))
+
+        lut = np.zeros(256, dtype='uint8')
+        lut[palette] = np.arange(len(palette))
+        per_word = 32 // bits
+        shifts = np.arange(per_word, dtype='uint32') * bits
+        indices = lut[voxels].reshape(-1, per_word).astype('uint32')
+        words = np.bitwise_or.reduce(indices << shifts, axis=1)
+        return cls(palette, words)
+
+    @property
+    def bits(self):
+        return len(self.words) * 32 // CHUNK_VOL
+
+    @property
+    def nbytes(self):
+        return self.palette.nbytes + self.words.nbytes
+
+    def get(self, voxel_index):
+        bits = self.bits
+        if not bits:
+            return self.palette[0]
+        per_word = 32 // bits
+        word = int(self.words[voxel_index // per_word])
+        return self.palette[(word >> (voxel_index % per_word * bits)) & ((1 << bits) - 1)]
+
+    def take(self, voxel_indices):
+        bits = self.bits
+        if not bits:
+            return np.full(voxel_indices.shape, self.palette[0], dtype='uint8')
+        per_word = 32 // bits
+        shifts = (voxel_indices % per_word * bits).astype('uint32')
+        return self.palette[(self.words[voxel_indices // per_word] >> shifts) & ((1 << bits) - 1)]
+
+    def set(self, voxel_index, voxel_id):
+        bits = self.bits
+        found = np.flatnonzero(self.palette == voxel_id)
+        if len(found):
+            if not bits:
+                # uniform chunk already made of this id
+                return
+            palette_index = int(found[0])
+        elif len(self.palette) < 1 << bits:
+            palette_index = len(self.palette)
+            self.palette = np.append(self.palette, np.uint8(voxel_id))
+        else:
+            # palette is full or the chunk is uniform, repack with more bits per voxel
+            voxels = self.to_dense()
+            voxels[voxel_index] = voxel_id
+            packed = PalettedChunk.from_dense(voxels)
+            self.palette, self.words = packed.palette, packed.words
+            return
+
+        per_word = 32 // bits
+        shift = voxel_index % per_word * bits
+        word = int(self.words[voxel_index // per_word])
+        word = word & ~(((1 << bits) - 1) << shift) | palette_index << shift
+        self.words[voxel_index // per_word] = word
+
+    def to_dense(self, out=None):
+        if out is None:
+            out = np.empty(CHUNK_VOL, dtype='uint8')
+        bits = self.bits
+        if not bits:
+            out[:] = self.palette[0]
+            return out
+
+        per_word = 32 // bits
+        shifts = np.arange(per_word, dtype='uint32') * bits
+        indices = (self.words[:, None] >> shifts) & ((1 << bits) - 1)
+        out[:] = self.palette[indices.reshape(-1)]
+        return out
+
+
+class VoxelStore:
+    def __init__(self, chunks, capacity=64):
+        self.chunks = chunks
+        # pool of chunk buffers handed out on demand
+        self.voxels = np.zeros([capacity, CHUNK_VOL], dtype='uint8')
+        # chunk index -> pool slot, -1 if the chunk has no dense buffer
+        self.slots = np.full(WORLD_VOL, -1, dtype='int32')
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        # chunk index -> packed voxels, kept while the dense buffer is unmodified
+        self.packed = {}
+        # bumped whenever the voxels of a chunk may change, lets readers cache results
+        self.versions = np.zeros(WORLD_VOL, dtype='int64')
+        # occupancy summary of every chunk: uniform id or -1 and fully solid faces,
+        # refreshed from the versions when read. chunks that are not loaded are air
+        self.occupancy_rows = np.empty(CHUNK_AREA, dtype='int64')
+        self.uniform = np.zeros(WORLD_VOL, dtype='int16')
+        self.opaque = np.zeros(WORLD_VOL, dtype='uint8')
+        self.summary_versions = np.zeros(WORLD_VOL, dtype='int64')
+
+    @property
+    def capacity(self):
+        return len(self.voxels)
+
+    @property
+    def resident(self):
+        return self.capacity - len(self.free_slots)
+
+    @property
+    def nbytes(self):
+        return self.resident * CHUNK_VOL + sum(packed.nbytes for packed in self.packed.values())
+
+    def is_resident(self, chunk_index):
+        return self.slots[chunk_index] != -1 or chunk_index in self.packed
+
+    def acquire(self, chunk_index):
+        self.packed.pop(chunk_index, None)
+        self.versions[chunk_index] += 1
+        slot = self.slots[chunk_index]
+        if slot == -1:
+            slot = self.get_free_slot()
+            self.voxels[slot] = 0
+            self.slots[chunk_index] = slot
+        return self.voxels[slot]
+
+    def release(self, chunk_index):
+        self.packed.pop(chunk_index, None)
+        self.versions[chunk_index] += 1
+        self.free_slot(chunk_index)
+
+    def get(self, chunk_index):
+        slot = self.slots[chunk_index]
+        if slot == -1:
+            return None
+        return self.voxels[slot]
+
+    def get_voxels(self, chunk_index):
+        # dense voxels for reading, packed chunks are unpacked into a temporary array
+        voxels = self.get(chunk_index)
+        if voxels is None and chunk_index in self.packed:
+            voxels = self.packed[chunk_index].to_dense()
+        return voxels
+
+    def summarize(self, chunk_index):
+        if self.summary_versions[chunk_index] == self.versions[chunk_index]:
+            return
+        self.summary_versions[chunk_index] = self.versions[chunk_index]
+        voxels = self.get_voxels(chunk_index)
+        if voxels is None:
+            self.uniform[chunk_index], self.opaque[chunk_index] = 0, 0
+            return
+        self.uniform[chunk_index], self.opaque[chunk_index] = fill_occupancy(voxels, self.occupancy_rows)
+
+    def get_uniform(self, chunk_index):
+        # id of a chunk made of a single voxel id, air for chunks not loaded, -1 otherwise
+        self.summarize(chunk_index)
+        return int(self.uniform[chunk_index])
+
+    def is_hidden(self, chunk_index):
+        # nothing of the chunk can be seen: all air, or all solid with every neighbour solid on the
+        # face towards it. outside of the world counts as solid like in get_padded
+        uniform = self.get_uniform(chunk_index)
+        if uniform <= 0:
+            return uniform == 0
+        x, y, z = chunk_index % WORLD_W, chunk_index // WORLD_AREA, chunk_index % WORLD_AREA // WORLD_W
+        for face, (dx, dy, dz) in enumerate(FACE_OFFSETS):
+            nx, ny, nz = x + dx, y + dy, z + dz
+            if not (0 <= nx < WORLD_W and 0 <= ny < WORLD_H and 0 <= nz < WORLD_D):
+                continue
+            neighbour_index = nx + WORLD_W * nz + WORLD_AREA * ny
+            self.summarize(neighbour_index)
+            if not self.opaque[neighbour_index] >> (face ^ 1) & 1:
+                return False
+        return True
+
+    def get_voxel(self, chunk_index, voxel_index):
+        slot = self.slots[chunk_index]
+        if slot != -1:
+            return self.voxels[slot, voxel_index]
+        return self.packed[chunk_index].get(voxel_index)
+
+    def expand(self, chunk_index):
+        slot = self.slots[chunk_index]
+        if slot != -1:
+            return self.voxels[slot]
+        if chunk_index not in self.packed:
+            return None
+
+        slot = self.get_free_slot()
+        self.slots[chunk_index] = slot
+        voxels = self.packed[chunk_index].to_dense(out=self.voxels[slot])
+        if chunk := self.chunks[chunk_index]:
+            chunk.voxels = voxels
+        return voxels
+
+    def get_padded(self, chunk_index, out=None):
+        # chunk voxels plus a one voxel border from its 26 neighbours, laid out (y, z, x)
+        if out is None:
+            out = np.empty(PADDED_VOL, dtype='uint8')
+        padded = out.reshape(PADDED_SIZE, PADDED_SIZE, PADDED_SIZE)
+        x, y, z = chunk_index % WORLD_W, chunk_index // WORLD_AREA, chunk_index % WORLD_AREA // WORLD_W
+
+        for dy, (dst_y, src_y) in PADDED_RANGES.items():
+            for dz, (dst_z, src_z) in PADDED_RANGES.items():
+                for dx, (dst_x, src_x) in PADDED_RANGES.items():
+                    nx, ny, nz = x + dx, y + dy, z + dz
+                    dst = padded[dst_y, dst_z, dst_x]
+
+                    # outside of the world counts as solid, chunks not loaded as air
+                    if not (0 <= nx < WORLD_W and 0 <= ny < WORLD_H and 0 <= nz < WORLD_D):
+                        dst[:] = 1
+                        continue
+                    neighbour_index = nx + WORLD_W * nz + WORLD_AREA * ny
+                    voxels = self.get(neighbour_index)
+                    if voxels is not None:
+                        dst[:] = voxels.reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)[src_y, src_z, src_x]
+                    elif neighbour_index not in self.packed:
+                        dst[:] = 0
+                    elif neighbour_index == chunk_index:
+                        dst[:] = self.packed[chunk_index].to_dense().reshape(CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+                    else:
+                        # border slabs are read straight from the packed words
+                        voxel_indices = (AXIS[src_x][None, None, :] + CHUNK_SIZE * AXIS[src_z][None, :, None] +
+                                         CHUNK_AREA * AXIS[src_y][:, None, None])
+                        dst[:] = self.packed[neighbour_index].take(voxel_indices)
+        return out
+
+    def edit(self, chunk_index):
+        # dense buffer becomes the only valid copy
+        voxels = self.expand(chunk_index)
+        self.packed.pop(chunk_index, None)
+        self.versions[chunk_index] += 1
+        return voxels
+
+    def pack(self, chunk_index):
+        voxels = self.get(chunk_index)
+        if voxels is None:
+            return
+        if chunk_index not in self.packed:
+            self.packed[chunk_index] = PalettedChunk.from_dense(voxels)
+        self.free_slot(chunk_index)
+        if chunk := self.chunks[chunk_index]:
+            chunk.voxels = None
+
+    def pack_uniform(self, chunk_index):
+        # a chunk of a single voxel id packs to one palette entry, it never needs a dense buffer
+        if self.get(chunk_index) is not None and self.get_uniform(chunk_index) >= 0:
+            self.pack(chunk_index)
+
+    def fill(self, chunk_index, voxel_id):
+        # loaded as a uniform chunk without ever taking a dense buffer
+        self.free_slot(chunk_index)
+        self.packed[chunk_index] = PalettedChunk(np.array([voxel_id], dtype='uint8'), np.empty(0, dtype='uint32'))
+        self.versions[chunk_index] += 1
+        if chunk := self.chunks[chunk_index]:
+            chunk.voxels = None
+
+    def pack_idle(self, keep, budget_ms=PACK_BUDGET_MS):
+        start = time.perf_counter()
+        for chunk_index in np.flatnonzero(self.slots != -1):
+            if chunk_index in keep:
+                continue
+            self.pack(chunk_index)
+            if time.perf_counter() - start > budget_ms * 0.001:
+                break
+
+    def get_free_slot(self):
+        if not self.free_slots:
+            self.grow()
+        return self.free_slots.pop()
+
+    def free_slot(self, chunk_index):
+        slot = self.slots[chunk_index]
+        if slot != -1:
+            self.slots[chunk_index] = -1
+            self.free_slots.append(slot)
+
+    def grow(self):
+        old_capacity = self.capacity
+        new_capacity = old_capacity * 2
+        voxels = np.zeros([new_capacity, CHUNK_VOL], dtype='uint8')
+        voxels[:old_capacity] = self.voxels
+        self.voxels = voxels
+        self.free_slots = list(range(new_capacity - 1, old_capacity - 1, -1)) + self.free_slots
+
+        # chunks hold views into the pool, point them to the new buffer
+        for chunk_index in np.flatnonzero(self.slots != -1):
+            chunk = self.chunks[chunk_index]
+            if chunk:
+                chunk.voxels = self.voxels[self.slots[chunk_index]]
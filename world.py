@@ -1,93 +1,132 @@
 from settings import *
 from world_objects.chunk import Chunk
 from voxel_handler import VoxelHandler
-from world_data_handler import save_world, load_chunk_by_index
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from voxel_store import VoxelStore
+from terrain_gen import generate_terrain_batch
+from heightmap import HeightmapCache, compute_height_tiles
+from region_storage import RegionStorage
+from chunk_streamer import ChunkStreamer
+from chunk_mesher import ChunkMesher
+from meshes.chunk_arena import ChunkArena
+from meshes.chunk_mesh import CHUNK_PROGRAM, CHUNK_VBO_FORMAT, CHUNK_ATTRS
+from world_edit import WorldEdit
 
 
 class World:
     def __init__(self, engine, new_world=False):
         self.engine = engine
         self.chunks = [None for _ in range(WORLD_VOL)]
-        self.voxels = np.empty([WORLD_VOL, CHUNK_VOL], dtype='uint8')
         self.new_world = new_world
+        # indices of chunks currently held in memory
+        self.loaded = set()
+        self.load_count = 0
+        self.unload_count = 0
+        # chunk voxels are pooled, only resident chunks own a buffer
+        if new_world:
+            capacity = WORLD_VOL
+        elif PACKED_CHUNKS:
+            capacity = 128
+        else:
+            capacity = UNLOAD_DISTANCE ** 2 * WORLD_H
+        self.voxel_store = VoxelStore(self.chunks, capacity=capacity)
+        # edited chunks that still have to be written to the region files,
+        # untouched chunks are regenerated from the seed instead of stored
+        self.dirty = set()
+        self.storage = RegionStorage()
+        self.heightmap = HeightmapCache()
+        # long-lived loader, owns the worker pool for the whole session
+        self.streamer = ChunkStreamer(self)
+        self.mesher = ChunkMesher(self)
+        # chunk meshes share one vertex buffer and are drawn together
+        program = getattr(engine.shader_program, CHUNK_PROGRAM)
+        self.arena = ChunkArena(engine, program, CHUNK_VBO_FORMAT, CHUNK_ATTRS)
+        # indices of chunks with a non-empty uploaded mesh, kept up to date on upload and unload
+        self.render_set = set()
+        self.render_list = None
         if new_world:
             self.build_chunks()
             self.build_chunk_mesh()
         self.voxel_handler = VoxelHandler(self)
 
     def update(self):
+        x, y, z = (int(self.engine.player.position[0] // CHUNK_SIZE), int(self.engine.player.position[1] // CHUNK_SIZE), int(self.engine.player.position[2] // CHUNK_SIZE))
         if not self.new_world:
-            x, y, z = (int(self.engine.player.position[0] // CHUNK_SIZE), int(self.engine.player.position[1] // CHUNK_SIZE), int(self.engine.player.position[2] // CHUNK_SIZE))
-            self.load_visible_chunks(x, y, z)
+            self.streamer.update((x, y, z))
+        self.mesher.update()
+        if PACKED_CHUNKS:
+            self.voxel_store.pack_idle(keep=self.get_active_chunks(x, y, z))
         self.voxel_handler.update()
+
+    @staticmethod
+    def get_active_chunks(center_x, center_y, center_z):
+        # chunks within ray cast reach stay dense for picking and editing
+        r = MAX_RAY_DIST // CHUNK_SIZE + 1
+        return {
+            x + WORLD_W * z + WORLD_AREA * y
+            for x in range(max(0, center_x - r), min(WORLD_W, center_x + r + 1))
+            for y in range(max(0, center_y - r), min(WORLD_H, center_y + r + 1))
+            for z in range(max(0, center_z - r), min(WORLD_D, center_z + r + 1))
+        }
     
-    def load_visible_chunks(self, center_x, center_y, center_z):
-        # localize constants for speed
-        WORLD_W_local = WORLD_W
-        WORLD_H_local = WORLD_H
-        WORLD_D_local = WORLD_D
-        WORLD_AREA_local = WORLD_AREA
-        CHUNK_VOL_local = CHUNK_VOL
-        R = RENDER_DISTANCE // 2
-
-        x0 = max(0, center_x - R)
-        x1 = min(WORLD_W_local, center_x + R)
-        z0 = max(0, center_z - R)
-        z1 = min(WORLD_D_local, center_z + R)
-        y0 = 0
-        y1 = WORLD_H_local
-
-        mesh_to_build = []
-        load_tasks = []
-        path = CHUNK_FILE_BASE_DIR / "world.dat"
-
-        # small thread pool for I/O; tune max_workers to your disk and CPU
-        with ThreadPoolExecutor(max_workers=4) as ex:
-            for xi in range(x0, x1):
-                for yi in range(y0, y1):
-                    for zi in range(z0, z1):
-                        idx = xi + WORLD_W_local * zi + WORLD_AREA_local * yi
-
-                        # skip if chunk already exists (loaded)
-                        if self.chunks[idx] is not None:
-                            continue
-
-                        # schedule load; do not create Chunk yet
-                        future = ex.submit(load_chunk_by_index, path, idx)
-                        load_tasks.append((future, idx, (xi, yi, zi)))
-
-            # collect results and create chunks
-            for future, idx, pos in ((f, i, p) for f, i, p in load_tasks):
-                try:
-                    vox = future.result()
-                except Exception:
-                    # on error, skip or create empty chunk
-                    vox = np.zeros(CHUNK_VOL_local, dtype=np.uint8)
-
-                # validate and normalize voxel array length
-                if vox is None:
-                    vox = np.zeros(CHUNK_VOL_local, dtype=np.uint8)
-                elif vox.size != CHUNK_VOL_local:
-                    if vox.size < CHUNK_VOL_local:
-                        padded = np.zeros(CHUNK_VOL_local, dtype=np.uint8)
-                        padded[:vox.size] = vox
-                        vox = padded
-                    else:
-                        vox = vox[:CHUNK_VOL_local]
+    def add_chunk(self, idx, vox):
+        # validate and normalize voxel array length, None is an air chunk
+        if vox is not None and vox.size != CHUNK_VOL:
+            if vox.size < CHUNK_VOL:
+                padded = np.zeros(CHUNK_VOL, dtype=np.uint8)
+                padded[:vox.size] = vox
+                vox = padded
+            else:
+                vox = vox[:CHUNK_VOL]
+
+        pos = (idx % WORLD_W, idx // WORLD_AREA, idx % WORLD_AREA // WORLD_W)
 
-                # create chunk and assign backing array
-                chunk = Chunk(self, position=pos)
-                self.chunks[idx] = chunk
-                self.voxels[idx] = vox
-                chunk.voxels = self.voxels[idx]
-                chunk.is_empty = not np.any(vox)
-                mesh_to_build.append(chunk)
+        # create chunk and assign backing array
+        chunk = Chunk(self, position=pos)
+        self.chunks[idx] = chunk
+        self.loaded.add(idx)
+        self.load_count += 1
+        if vox is None:
+            # packed air, never takes a dense buffer
+            self.voxel_store.fill(idx, 0)
+            chunk.is_empty = True
+        else:
+            chunk.voxels = self.voxel_store.acquire(idx)
+            chunk.voxels[:] = vox
+            chunk.is_empty = not np.any(vox)
+            self.voxel_store.pack_uniform(idx)
+        chunk.build_mesh()
+        return chunk
 
-        # build meshes in batch (your existing method)
-        self.rebuild_chunk_mesh(mesh_to_build)
+    def edit(self):
+        # batch of voxel edits, see WorldEdit
+        return WorldEdit(self)
 
+    def unload_far_chunks(self, center_x, center_z):
+        R = UNLOAD_DISTANCE // 2
+        far = [
+            idx for idx in self.loaded
+            if abs(idx % WORLD_W - center_x) > R or abs(idx % WORLD_AREA // WORLD_W - center_z) > R
+        ]
+        for idx in far:
+            self.unload_chunk(idx)
 
+    def unload_chunk(self, idx):
+        chunk = self.chunks[idx]
+        if chunk is None:
+            return
+        if idx in self.dirty:
+            self.storage.save_chunk(idx, self.voxel_store.get_voxels(idx))
+            self.dirty.discard(idx)
+        self.mesher.cancel(idx)
+        self.remove_from_render_list(idx)
+        if chunk.mesh:
+            chunk.mesh.release()
+            chunk.mesh = None
+        chunk.voxels = None
+        self.voxel_store.release(idx)
+        self.chunks[idx] = None
+        self.loaded.discard(idx)
+        self.unload_count += 1
 
     # def build_chunk_by_position(self, pos=(0,0,0)):
     #     x, y, z = pos
@@ -126,6 +165,14 @@ class World:
         # self.rebuild_chunk_mesh(pos)
         
     def build_chunks(self):
+        # one height tile per chunk column, shared by its vertical chunks
+        columns = np.array([(x, z) for x in range(WORLD_W) for z in range(WORLD_D)], dtype='int64')
+        heights = np.empty([len(columns), CHUNK_SIZE, CHUNK_SIZE], dtype='int32')
+        compute_height_tiles(heights, columns)
+        max_heights = heights.max(axis=(1, 2))
+
+        new_chunks = []
+        tile_ids = []
         for x in range(WORLD_W):
             for y in range(WORLD_H):
                 for z in range(WORLD_D):
@@ -134,24 +181,78 @@ class World:
                     chunk_index = x + WORLD_W * z + WORLD_AREA * y
                     self.chunks[chunk_index] = chunk
 
-                    # put the chunk voxels in a separate array
-                    self.voxels[chunk_index] = chunk.build_voxels()
+                    self.loaded.add(chunk_index)
+
+                    # chunks above the terrain stay air without being generated or taking a dense buffer
+                    tile_id = x * WORLD_D + z
+                    if y * CHUNK_SIZE < max_heights[tile_id]:
+                        # get pointer to pooled voxels, they are filled in place below
+                        chunk.voxels = self.voxel_store.acquire(chunk_index)
+                        new_chunks.append(chunk)
+                        tile_ids.append(tile_id)
+                    else:
+                        self.voxel_store.fill(chunk_index, 0)
+
+        # generate all chunks in parallel straight into the pool
+        generate_terrain_batch(
+            self.voxel_store.voxels,
+            self.voxel_store.slots[[chunk.index for chunk in new_chunks]],
+            np.array([chunk.position for chunk in new_chunks], dtype='int64'),
+            heights,
+            np.array(tile_ids, dtype='int64')
+        )
+        for chunk in new_chunks:
+            chunk.is_empty = not np.any(chunk.voxels)
+            self.voxel_store.pack_uniform(chunk.index)
+
+    def save(self):
+        # only chunks changed since the last save are written
+        for idx in self.dirty:
+            if self.chunks[idx] and self.voxel_store.is_resident(idx):
+                self.storage.save_chunk(idx, self.voxel_store.get_voxels(idx))
+        self.dirty.clear()
 
-                    # get pointer to voxels
-                    chunk.voxels = self.voxels[chunk_index]
-        # save_world(CHUNK_FILE_BASE_DIR /  "world.dat", self.voxels)
+    def close(self):
+        self.streamer.shutdown()
+        self.mesher.shutdown()
+        self.save()
+        self.storage.compact()
+        self.storage.close()
+        self.arena.release_all()
 
     def build_chunk_mesh(self):
         for chunk in self.chunks:
             if chunk:
                 chunk.build_mesh()
+                # bound the padded copies waiting for the workers
+                if len(self.mesher.queue) >= MESH_BATCH_SIZE:
+                    self.mesher.flush()
+        self.mesher.flush()
 
     def rebuild_chunk_mesh(self, chunks):
         for chunk in chunks:
             if chunk:
                 chunk.build_mesh()
 
+    def update_render_list(self, chunk):
+        if chunk.mesh and chunk.mesh.is_uploaded and not chunk.is_empty:
+            if chunk.index not in self.render_set:
+                self.render_set.add(chunk.index)
+                self.render_list = None
+        else:
+            self.remove_from_render_list(chunk.index)
+
+    def remove_from_render_list(self, idx):
+        if idx in self.render_set:
+            self.render_set.discard(idx)
+            self.render_list = None
+
     def render(self):
-        for chunk in self.chunks:
-            if chunk:
-                chunk.render()
+        if self.render_list is None:
+            self.render_list = np.fromiter(self.render_set, dtype='int64', count=len(self.render_set))
+        frustum = self.engine.player.frustum
+        visible = self.render_list[frustum.get_visible()[self.render_list]]
+
+        # front to back, near chunks fill the depth buffer first and hide what is behind them
+        distance = np.sum((frustum.centers[visible] - np.array(self.engine.player.position)) ** 2, axis=1)
+        self.arena.render(visible[np.argsort(distance)])
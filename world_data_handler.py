@@ -1,48 +1,49 @@
+import mmap
 import struct
 import numpy as np
+from numba import njit
 from pathlib import Path
 
 CHUNK_HEADER_FMT = "<I"   # uint32 length of block in bytes
 RUN_FMT = "<I B"          # uint32 count, uint8 id
 RUN_SIZE = struct.calcsize(RUN_FMT)
 
+# packed run record matching RUN_FMT, lets NumPy view the run table without parsing
+RUN_DTYPE = np.dtype([('count', '<u4'), ('id', 'u1')])
+
+
 def pack_chunk_to_bytes(chunk_voxels: np.ndarray) -> bytes:
     if chunk_voxels.size == 0:
         return b''
-    parts = []
-    curr = int(chunk_voxels[0])
-    cnt = 1
-    for v in chunk_voxels[1:]:
-        v = int(v)
-        if v == curr:
-            cnt += 1
-        else:
-            parts.append(struct.pack(RUN_FMT, cnt, curr))
-            curr = v
-            cnt = 1
-    parts.append(struct.pack(RUN_FMT, cnt, curr))
-    return b''.join(parts)
+    voxels = np.ascontiguousarray(chunk_voxels, dtype=np.uint8).reshape(-1)
+    # a run starts wherever the id differs from the previous voxel
+    starts = np.concatenate(([0], np.flatnonzero(voxels[1:] != voxels[:-1]) + 1))
+    runs = np.empty(len(starts), dtype=RUN_DTYPE)
+    runs['count'] = np.diff(np.append(starts, voxels.size))
+    runs['id'] = voxels[starts]
+    return runs.tobytes()
+
+
+@njit(nogil=True)
+def decode_runs(data, out):
+    pos = 0
+    for offset in range(0, len(data) - RUN_SIZE + 1, RUN_SIZE):
+        cnt = (np.uint32(data[offset]) | np.uint32(data[offset + 1]) << 8 |
+               np.uint32(data[offset + 2]) << 16 | np.uint32(data[offset + 3]) << 24)
+        end = min(pos + cnt, len(out))
+        out[pos:end] = data[offset + 4]
+        pos = end
+    return pos
+
 
 def unpack_chunk_from_bytes(data: bytes) -> np.ndarray:
     if not data:
         return np.empty(0, dtype=np.uint8)
     n_runs = len(data) // RUN_SIZE
-    # view as array of runs
-    runs = np.frombuffer(data, dtype=np.uint8).reshape(-1)  # fallback
-    # safer: iterate runs but it's still fast because it's binary
-    out = []
-    offset = 0
-    while offset + RUN_SIZE <= len(data):
-        cnt, vid = struct.unpack_from(RUN_FMT, data, offset)
-        out.append((cnt, vid))
-        offset += RUN_SIZE
-    # preallocate
-    total = sum(cnt for cnt, _ in out)
-    arr = np.empty(total, dtype=np.uint8)
-    pos = 0
-    for cnt, vid in out:
-        arr[pos:pos+cnt] = vid
-        pos += cnt
+    runs = np.frombuffer(data, dtype=RUN_DTYPE, count=n_runs)
+    arr = np.empty(int(runs['count'].sum()), dtype=np.uint8)
+    # the kernel releases the GIL, loader threads decode in parallel
+    decode_runs(np.frombuffer(data, dtype=np.uint8), arr)
     return arr
 
 def save_world(path: Path, chunks: list):
@@ -72,4 +73,44 @@ def load_chunk_by_index(path: Path, idx: int) -> np.ndarray:
         data = f.read(length)
         return unpack_chunk_from_bytes(data)
 
+class WorldReader:
+    # maps world.dat once and serves chunks without further syscalls, safe to share between threads
+    def __init__(self, path: Path):
+        self.path = path
+        self.file = None
+        self.mm = None
+        self.view = None
+        self.offsets = np.empty(0, dtype='<u8')
+
+        if not path.exists() or path.stat().st_size < 4:
+            return
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        n_chunks = struct.unpack_from("<I", self.mm, 0)[0]
+        self.offsets = np.frombuffer(self.mm, dtype='<u8', count=n_chunks, offset=4)
+
+    def read(self, idx: int):
+        if not 0 <= idx < len(self.offsets):
+            return None
+        off = int(self.offsets[idx])
+        length = struct.unpack_from(CHUNK_HEADER_FMT, self.mm, off)[0]
+        start = off + struct.calcsize(CHUNK_HEADER_FMT)
+        return self.view[start:start + length]
+
+    def load_chunk(self, idx: int):
+        data = self.read(idx)
+        if data is None:
+            return None
+        return unpack_chunk_from_bytes(data)
+
+    def close(self):
+        if self.mm is None:
+            return
+        self.offsets = np.empty(0, dtype='<u8')
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+        self.mm = self.view = self.file = None
+
 # print(load_chunk_by_index(Path("world_data/chunks/world.dat"), 0))
\ No newline at end of file
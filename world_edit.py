@@ -0,0 +1,128 @@
+from settings import *
+
+# the 27 offsets of a voxel and its neighbours
+OFFSETS = np.array([(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)])
+
+
+class WorldEdit:
+    # collects voxel edits and applies them at once, every touched chunk is remeshed a single time.
+    # use as a context manager, edits are applied when the block exits:
+    #     with world.edit() as edit:
+    #         edit.fill_box((0, 0, 0), (10, 10, 10), STONE)
+    def __init__(self, world):
+        self.world = world
+        self.positions = []
+        self.voxel_ids = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.apply()
+
+    def set(self, positions, voxel_ids):
+        # world voxel positions (n, 3) and one id for all or one per position, later edits win
+        positions = np.asarray(positions, dtype='int64').reshape(-1, 3)
+        voxel_ids = np.broadcast_to(np.asarray(voxel_ids, dtype='uint8'), len(positions))
+        self.positions.append(positions)
+        self.voxel_ids.append(voxel_ids)
+        return self
+
+    def fill_box(self, start, end, voxel_id):
+        # every voxel from start to end, both inclusive
+        axes = [np.arange(min(a, b), max(a, b) + 1) for a, b in zip(start, end)]
+        grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1)
+        return self.set(grid, voxel_id)
+
+    def fill_sphere(self, center, radius, voxel_id):
+        r = int(math.ceil(radius))
+        axes = [np.arange(int(c) - r, int(c) + r + 1) for c in center]
+        grid = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        inside = np.sum((grid - np.asarray(center)) ** 2, axis=1) <= radius * radius
+        return self.set(grid[inside], voxel_id)
+
+    def paste(self, origin, voxels, skip_air=True):
+        # structure indexed [x, y, z] placed with its first voxel at origin
+        voxels = np.asarray(voxels, dtype='uint8')
+        positions = np.argwhere(voxels != 0) if skip_air else np.argwhere(np.ones_like(voxels, dtype=bool))
+        return self.set(positions + np.asarray(origin), voxels[tuple(positions.T)])
+
+    def apply(self):
+        # returns the indices of the chunks that were changed
+        if not self.positions:
+            return set()
+        positions = np.concatenate(self.positions)
+        voxel_ids = np.concatenate(self.voxel_ids)
+        self.positions, self.voxel_ids = [], []
+
+        # only voxels of loaded chunks can be edited
+        chunk_pos = positions // CHUNK_SIZE
+        cx, cy, cz = chunk_pos.T
+        in_world = (0 <= cx) & (cx < WORLD_W) & (0 <= cy) & (cy < WORLD_H) & (0 <= cz) & (cz < WORLD_D)
+        positions, voxel_ids, chunk_pos = positions[in_world], voxel_ids[in_world], chunk_pos[in_world]
+        chunk_indices = chunk_pos[:, 0] + WORLD_W * chunk_pos[:, 2] + WORLD_AREA * chunk_pos[:, 1]
+        loaded = np.isin(chunk_indices, np.fromiter(self.world.loaded, dtype='int64'))
+        positions, voxel_ids, chunk_indices = positions[loaded], voxel_ids[loaded], chunk_indices[loaded]
+        if not len(positions):
+            return set()
+
+        local = positions % CHUNK_SIZE
+        voxel_indices = local[:, 0] + CHUNK_SIZE * local[:, 2] + CHUNK_AREA * local[:, 1]
+
+        # keep the last edit of every voxel
+        keys = chunk_indices * CHUNK_VOL + voxel_indices
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        chunk_indices, voxel_indices, voxel_ids = chunk_indices[last], voxel_indices[last], voxel_ids[last]
+        edited = positions[last]
+
+        # one vectorized write per chunk, keys are sorted so each chunk is a contiguous run
+        touched, starts = np.unique(chunk_indices, return_index=True)
+        ends = np.append(starts[1:], len(chunk_indices))
+        voxel_store = self.world.voxel_store
+        for chunk_index, start, end in zip(touched.tolist(), starts, ends):
+            voxels = voxel_store.edit(chunk_index)
+            voxels[voxel_indices[start:end]] = voxel_ids[start:end]
+            self.world.dirty.add(chunk_index)
+            self.world.chunks[chunk_index].is_empty = not np.any(voxels)
+
+        for chunk_index, sections in self.get_affected_sections(edited).items():
+            chunk = self.world.chunks[chunk_index]
+            if chunk and chunk.mesh:
+                chunk.mesh.rebuild(sections)
+        return set(touched.tolist())
+
+    def get_affected_sections(self, positions):
+        # faces and ao can change for every neighbour of an edited voxel, so a section is
+        # affected if it holds an edited voxel or borders one. returns chunk index -> sections
+        section_pos = positions // SECTION_SIZE
+        local = positions % SECTION_SIZE
+        # -1 or 1 on an axis where the voxel lies on the low or high border of its section
+        border = (local == SECTION_SIZE - 1).astype('int64') - (local == 0)
+
+        # reduce to the distinct (section, border) pairs before expanding to neighbours
+        shape = np.array([WORLD_W, WORLD_H, WORLD_D]) * SECTIONS
+        codes = np.ravel_multi_index((*section_pos.T, *(border + 1).T), (*shape, 3, 3, 3))
+        rows = np.stack(np.unravel_index(np.unique(codes), (*shape, 3, 3, 3)), axis=1)
+        section_pos, border = rows[:, :3], rows[:, 3:] - 1
+
+        affected = []
+        for offset in OFFSETS:
+            # sections in this direction are affected if the voxel lies on that border
+            mask = np.all((offset == 0) | (offset == border), axis=1)
+            affected.append(section_pos[mask] + offset)
+        affected = np.unique(np.concatenate(affected), axis=0)
+
+        chunk_pos = affected // SECTIONS
+        cx, cy, cz = chunk_pos.T
+        in_world = (0 <= cx) & (cx < WORLD_W) & (0 <= cy) & (cy < WORLD_H) & (0 <= cz) & (cz < WORLD_D)
+        affected, chunk_pos = affected[in_world], chunk_pos[in_world]
+        chunk_indices = chunk_pos[:, 0] + WORLD_W * chunk_pos[:, 2] + WORLD_AREA * chunk_pos[:, 1]
+        sx, sy, sz = (affected % SECTIONS).T
+        sections = sx + SECTIONS * sz + SECTION_AREA * sy
+
+        result = {}
+        for chunk_index, section in zip(chunk_indices.tolist(), sections.tolist()):
+            result.setdefault(chunk_index, []).append(section)
+        return {chunk_index: tuple(sorted(s)) for chunk_index, s in result.items()}
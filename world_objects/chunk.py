@@ -1,7 +1,5 @@
 from settings import *
 from meshes.chunk_mesh import ChunkMesh
-import random
-from terrain_gen import *
 
 
 class Chunk:
@@ -9,49 +7,13 @@ class Chunk:
         self.engine = world.engine
         self.world = world
         self.position = position
-        self.m_model = self.get_model_matrix()
+        self.index = position[0] + WORLD_W * position[2] + WORLD_AREA * position[1]
         self.voxels: np.array = None
         self.mesh: ChunkMesh = None
         self.is_empty = True
 
         self.center = (glm.vec3(self.position) + 0.5) * CHUNK_SIZE
-        self.is_on_frustum = self.engine.player.frustum.is_on_frustum
-
-    def get_model_matrix(self):
-        m_model = glm.translate(glm.mat4(), glm.vec3(self.position) * CHUNK_SIZE)
-        return m_model
-
-    def set_uniform(self):
-        self.mesh.program['m_model'].write(self.m_model)
 
     def build_mesh(self):
         self.mesh = ChunkMesh(self)
-
-    def render(self):
-        if not self.is_empty and self.is_on_frustum(self):
-            self.set_uniform()
-            self.mesh.render()
-
-    def build_voxels(self):
-        voxels = np.zeros(CHUNK_VOL, dtype='uint8')
-
-        cx, cy, cz = glm.ivec3(self.position) * CHUNK_SIZE
-        self.generate_terrain(voxels, cx, cy, cz)
-
-        if np.any(voxels):
-            self.is_empty = False
-        return voxels
-
-    @staticmethod
-    @njit
-    def generate_terrain(voxels, cx, cy, cz):
-        for x in range(CHUNK_SIZE):
-            wx = x + cx
-            for z in range(CHUNK_SIZE):
-                wz = z + cz
-                world_height = get_height(wx, wz)
-                local_height = min(world_height - cy, CHUNK_SIZE)
-
-                for y in range(local_height):
-                    wy = y + cy
-                    set_voxel_id(voxels, x, y, z, wx, wy, wz, world_height)
+        self.world.mesher.request(self)